@@ -21,6 +21,12 @@
         'fava>=1.22',
         'pandas>=1.0.0'
     ],
+    extras_require={
+        'parquet': ['pyarrow'],
+    },
+    entry_points={
+        'console_scripts': ['fava-envelope = envelope_budget.cli:main'],
+    },
     zip_safe=False,
     classifiers=[
         'Development Status :: 3 - Alpha',
@@ -5,25 +5,102 @@
 from beancount.core.convert import get_cost
 from beancount.core.number import ZERO
 from beancount.core.inventory import Inventory, Amount
-from beancount.core import convert
 
 import datetime
+import hashlib
 
+from flask import Response, abort, jsonify, request
 from fava.core import cost_or_value
 from fava.core.tree import TreeNode
-from fava.ext import FavaExtensionBase
+from fava.ext import FavaExtensionBase, extension_endpoint
 from beancount.core.number import Decimal
 from beancount.core import data
 
 import collections
+import functools
+import json
+import os
+import re
+import time
 import traceback
+import weakref
+from concurrent.futures import ThreadPoolExecutor
 
-from envelope_budget.modules.beancount_envelope import BeancountEnvelope
-from envelope_budget.modules.envelope_extension import EnvelopeWrapper, Target
+# the engine (pandas, numpy, ...) is imported on the first computation, not when fava loads the extension
+from envelope_budget.modules.budget_cache import BudgetCache
+from envelope_budget.modules.hierarchy.contributions import ContributionStore
+from envelope_budget.modules.ledger_context import LedgerContext
+from envelope_budget.modules.timing import Timings, collect, span
 
 LoadError = collections.namedtuple('LoadError', 'source message entry')
 
 
+def __getattr__(name):
+    # these used to be imported here eagerly
+    if name == 'BeancountEnvelope':
+        from envelope_budget.modules.beancount_envelope import BeancountEnvelope
+        return BeancountEnvelope
+    if name in ('EnvelopeWrapper', 'Target'):
+        from envelope_budget.modules import envelope_extension
+        return getattr(envelope_extension, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# the format of the period argument, e.g. 2020-01
+PERIOD = re.compile(r'\d{4}-\d{2}')
+
+# the values of a PeriodSummary in the JSON of a period
+SUMMARY_FIELDS = ('to_be_budgeted', 'available_funds', 'income', 'overspent_prev', 'budgeted', 'budgeted_next',
+                  'stealing')
+
+
+def _sign(number):
+    return 'negative' if number < 0 else 'positive' if number > 0 else ''
+
+
+class TreeRow:
+    """One line of the envelope tree, with all the values the template shows already formatted."""
+
+    def __init__(self, account, depth, display_name):
+        self.account = account
+        self.depth = depth
+        self.display_name = display_name
+        self.has_children = False
+        self.row_class = 1
+        self.collapsed = False
+        self.is_real_account = False
+        self.is_bucket = False
+        self.is_non_budget = False
+        self.is_leaf = False
+        # number of levels of the tree that end after this row
+        self.close = 0
+
+        self.goal = ''
+        self.goal_children = ''
+        self.has_goal = False
+        self.goal_type = ''
+        self.is_overfunded = False
+        self.show_progress = False
+        self.goal_progress = None
+
+        self.budgeted = ''
+        self.budgeted_children = ''
+        self.has_budgeted = False
+        self.budgeted_sign = ''
+
+        self.spent = ''
+        self.spent_children = ''
+        self.has_spent = False
+        self.spent_sign = ''
+
+        self.available = ''
+        self.available_children = ''
+        self.has_available = False
+        self.available_class = ''
+        # 'funded', 'underfunded' or None: the mark shown in front of the available amount
+        self.funding = None
+
+
 class EnvelopeBudgetColor(FavaExtensionBase):
     '''
     '''
@@ -32,50 +109,191 @@ class EnvelopeBudgetColor(FavaExtensionBase):
     def __init__(self, ledger, config=None):
         super().__init__(ledger, config)
         self.display_real_accounts = False
-        self.envelopes: EnvelopeWrapper = EnvelopeWrapper([], [], [], None)
+        self._envelopes = None
+        self.cache = BudgetCache()
+        # kept across reloads, so only changed transactions are parsed again
+        self.contributions = collections.defaultdict(ContributionStore)
+        self._context = None
 
         self.income_tables = None
+        self._tree_rows = functools.lru_cache(maxsize=64)(self._build_tree_rows)
+
+        # computes the results of a freshly loaded ledger before they are requested, once the page was used
+        self._warm_up_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='fava-envelope-warm-up')
+        weakref.finalize(self, self._warm_up_executor.shutdown, wait=False)
+        self.warm_up = None
+        self._used = False
+        # the process pool and the number of its workers, see _workers
+        self._process_pool = None
+        self._pool_workers = None
+        self._close_pool = None
+        self._source_hash = None
+        # the stages of the current request, if configured with 'timings': True
+        self.timings = None
+        self._render = None
+
+    def after_load_file(self):
+        self.cache.invalidate()
+        self._tree_rows.cache_clear()
+        self._context = None
+        self._source_hash = None
+        if self._pool_workers != self._configured_workers():
+            self._close_process_pool()
+        # not on the initial load: the engine is only imported once the extension is used
+        if self._used and self.config.get('warm_up', True):
+            self.warm_up = self._warm_up_executor.submit(self._warm_up, self.cache.generation)
+
+    @property
+    def envelopes(self):
+        if self._envelopes is None:
+            from envelope_budget.modules.envelope_extension import EnvelopeWrapper
+            self._envelopes = EnvelopeWrapper(None)
+        return self._envelopes
+
+    @envelopes.setter
+    def envelopes(self, envelopes):
+        self._envelopes = envelopes
+
+    def _warm_up(self, generation):
+        """Compute all budgets and the current, previous and next period of each (both with and without accounts)."""
+        today = datetime.date.today().replace(day=1)
+        periods = [self._period_for(today - datetime.timedelta(days=1)), self._period_for(today),
+                   self._period_for(today + datetime.timedelta(days=31))]
+
+        try:
+            for budget in self.get_budgets() or [None]:
+                if generation != self.cache.generation:
+                    return
+                envelopes = self._compute_budget(budget)
+                available = set(envelopes.get_budgets_months_available()) if envelopes.initialized else set()
+                for period in (p for p in periods if p in available):
+                    for show_real in (False, True):
+                        self._tree_rows(envelopes.get_inventories(period, show_real), show_real)
+        except Exception:
+            # the request computing the same budget reports the error
+            logging.exception("warming up the budget cache failed")
+
+    @property
+    def context(self):
+        if self._context is None:
+            self._context = LedgerContext.from_fava(self.ledger)
+        return self._context
+
+    def _cache_key(self, budget):
+        # the current month is derived from today, so results are only valid for the day they were computed
+        return self.cache.key(self.ledger.mtime, budget, datetime.date.today(), repr(self.config))
 
     def generate_budget_df(self, budget):
 
         self.ledger.errors = list(filter(lambda i: not (type(i) is LoadError), self.ledger.errors))
 
         try:
-            start_date = self.config.get('start')
-
-            if start_date is not None:
-                start_date = datetime.date.fromisoformat(start_date)
-
-            future_months = self.config.get('future_months')
-            future_rollover = self.config.get('future_rollover')
-            show_real_accounts = self.config.get('show_real_accounts')
-
-            if 'budgets' in self.config:
-                budgets = self.config['budgets']
-            else:
-                logging.error("budget config not found!")
-
-            suffix = ''
-            if budgets:
-                budget = budget if budget else list(budgets.keys())[0]
-
-            if budget and budget in budgets:
-                values = budgets[budget]
-                suffix = values[0]
-            #               currency = values[1]
-
-            module = BeancountEnvelope(
-                self.ledger.all_entries,
-                self.ledger.errors,
-                self.ledger.options, suffix,
-                start_date, future_months, future_rollover, show_real_accounts
-            )
-
-            self.envelopes = EnvelopeWrapper(self.ledger.all_entries, self.ledger.errors, self.ledger.options, module)
+            self.envelopes = self._compute_budget(budget)
         except:
             self.ledger.errors.append(
                 LoadError(data.new_metadata("<fava-envelope-gen>", 0), traceback.format_exc(), None))
 
+    def _compute_budget(self, budget):
+        """The EnvelopeWrapper of a budget, from the cache or computed along with all other budgets."""
+        from envelope_budget.modules.beancount_envelope import BeancountEnvelope, budget_options
+        from envelope_budget.modules.envelope_extension import build_wrappers, build_wrappers_in_processes
+
+        budgets = self.config.get('budgets')
+        if budgets is None:
+            logging.error("budget config not found!")
+            budgets = dict()
+
+        if budgets:
+            budget = budget if budget else list(budgets.keys())[0]
+
+        context = self.context
+        options = budget_options(self.config)
+
+        def compute(keys):
+            disk = self._disk_cache()
+            if disk is not None and self._disk_key(budget) is None:
+                disk = None
+            results = dict()
+            if disk is not None:
+                for key in keys:
+                    stored = disk.get(self._disk_key(names_by_key[key]))
+                    if stored is not None:
+                        results[key] = stored
+                keys = [k for k in keys if k not in results]
+                if not keys:
+                    return results
+
+            names = [names_by_key[k] for k in keys]
+            postfixes = [budgets[name][0] if name in budgets else '' for name in names]
+            executor = self._workers()
+            if executor is not None and len(names) > 1:
+                wrappers = build_wrappers_in_processes(executor, context, [(p, options) for p in postfixes])
+            else:
+                wrappers = build_wrappers([BeancountEnvelope(context, postfix, contributions=self.contributions[name],
+                                                             **options)
+                                           for name, postfix in zip(names, postfixes)])
+            for key, name, wrapper in zip(keys, names, wrappers):
+                if disk is not None:
+                    disk.put(self._disk_key(name), wrapper)
+                results[key] = wrapper
+            return results
+
+        # the other budgets are computed along: they share the pass over the transactions
+        names_by_key = {self._cache_key(name): name for name in [budget] + [b for b in budgets if b != budget]}
+        return self.cache.get_or_compute(list(names_by_key), compute)
+
+    def _disk_cache(self):
+        """The cache of computed budgets that outlives the process, if configured with e.g. 'cache_dir': '.cache'."""
+        directory = self.config.get('cache_dir')
+        if not directory:
+            return None
+        from envelope_budget.modules.disk_cache import DiskCache
+        from envelope_budget.modules.envelope_extension import EnvelopeWrapper
+
+        directory = os.path.join(os.path.dirname(self.ledger.beancount_file_path), os.path.expanduser(directory))
+        return DiskCache(directory, EnvelopeWrapper.TABLES)
+
+    def _disk_key(self, budget):
+        """The key of a budget in the disk cache, None if the files of the ledger cannot be read."""
+        if self._source_hash is None:
+            from envelope_budget.modules.disk_cache import source_hash
+            try:
+                self._source_hash = source_hash(self.ledger.options['include'])
+            except OSError:
+                logging.warning("not using the budget cache, the ledger files cannot be read", exc_info=True)
+                return None
+        return self._source_hash, budget, datetime.date.today(), repr(self.config)
+
+    def _configured_workers(self):
+        workers = self.config.get('workers')
+        return workers if workers and workers >= 2 else None
+
+    def _workers(self):
+        """The process pool computing budgets in parallel, if configured with e.g. 'workers': 4."""
+        workers = self._configured_workers()
+        if workers != self._pool_workers:
+            self._close_process_pool()
+        if workers is None:
+            return None
+        if self._process_pool is None:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+
+            # workers are spawned, forking the threads of the web server is not safe
+            self._process_pool = ProcessPoolExecutor(max_workers=workers,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+            self._pool_workers = workers
+            # the worker processes end with the extension (or the interpreter)
+            self._close_pool = weakref.finalize(self, self._process_pool.shutdown, wait=False)
+        return self._process_pool
+
+    def _close_process_pool(self):
+        if self._close_pool is not None:
+            self._close_pool()
+        self._process_pool = None
+        self._pool_workers = None
+        self._close_pool = None
+
     def get_budgets(self):
         if 'budgets' in self.config:
             budgets = self.config['budgets']
@@ -113,17 +331,38 @@ def generate_income_query_tables(self, month):
 
     def make_table(self, period, show_accounts, budget=None):
         self.ledger.errors = list(filter(lambda i: not (type(i) is LoadError), self.ledger.errors))
+        self._used = True
+        self.timings = Timings() if self.config.get('timings') else None
         try:
             logging.info(f"period: {period}, show accounts: {show_accounts}")
-            return self._make_table(period, show_accounts, budget)
+            with collect(self.timings), span('make table'):
+                return self._make_table(period, show_accounts, budget)
         except:
             self.ledger.errors.append(
                 LoadError(data.new_metadata("<fava-envelope-table>", 0), traceback.format_exc(), None))
+        finally:
+            if self.timings is not None:
+                # the rest of the page, until finish_timings is called at its end
+                self._render = self.timings.start('render'), time.perf_counter()
+
+    def finish_timings(self):
+        """Log the stages of the current request and return them (None if not measured), called at the end of the page."""
+        timings = self.timings
+        if timings is None:
+            return None
+
+        if self._render is not None:
+            path, start = self._render
+            timings.stop(path, time.perf_counter() - start)
+            self._render = None
+        logging.info(f"timings: {json.dumps(timings.as_dict())}")
+        return timings
 
     def _make_table(self, period, show_accounts, budget):
         """An account tree based on matching regex patterns."""
         self.set_show_accounts(show_accounts)
-        self.generate_budget_df(budget)
+        with span('budget'):
+            self.generate_budget_df(budget)
 
         today = datetime.date.today()
 
@@ -137,10 +376,144 @@ def _make_table(self, period, show_accounts, budget):
         self.period_start = datetime.date(year, month, 1)
         self.period_end = datetime.date(year + month // 12, month % 12 + 1, 1)
 
-        self.period_data = self.envelopes.get_inventories(period=period,
-                                                          include_real_accounts=self.display_real_accounts)
+        with span('period data'):
+            self.period_data = self.envelopes.get_inventories(period=period,
+                                                              include_real_accounts=self.display_real_accounts)
         return self.period_data, period, budget
 
+    def tree_rows(self):
+        """The visible rows of the envelope tree of the current table, in display order."""
+        with collect(self.timings), span('tree rows'):
+            return self._tree_rows(self.period_data, self.display_real_accounts)
+
+    def _build_tree_rows(self, period_data, show_real):
+        collapse_patterns = self.ledger.fava_options.collapse_pattern
+        rows = []
+
+        def visible(accounts):
+            return [a for a in accounts if period_data.is_visible(a, show_real=show_real)]
+
+        def add(a, depth, children):
+            account_row = period_data.account_row(a)
+            row = TreeRow(a.account, depth, self._name(a))
+            row.has_children = len(children) > 0
+            row.row_class = 1 if row.has_children else 1 - (rows[-1].row_class if rows else 1)
+            row.collapsed = any(pattern.match(a.account) for pattern in collapse_patterns)
+            row.is_real_account = self._is_real_account(a)
+            row.is_bucket = account_row.is_bucket
+            row.is_non_budget = account_row.is_non_budget()
+
+            goal = self._value(account_row.display_goal.amount)
+            row.goal = self.format_amount(goal, show_if_zero=False)
+            row.has_goal = bool(goal)
+            row.goal_type = account_row.goal_type if account_row.display_goal else ''
+            row.is_overfunded = account_row.is_overfunded
+            row.show_progress = not row.is_non_budget and not account_row.is_fully_funded
+            row.goal_progress = account_row.goal_progress
+
+            spent = self._value(account_row.spent)
+            row.spent = self.format_amount(spent, show_if_zero=False)
+            row.has_spent = bool(spent)
+            row.spent_sign = _sign(spent.number)
+            row.spent_children = self.format_amount(self._only_position(period_data.subtree_total(a, 'spent')))
+
+            if row.is_non_budget:
+                row.goal_children = self.format_amount(self._only_position(period_data.subtree_total(a, 'goals')))
+            else:
+                budgeted = self._value(account_row.budgeted)
+                row.budgeted = self.format_amount(budgeted)
+                row.has_budgeted = bool(budgeted)
+                row.budgeted_sign = _sign(budgeted.number)
+                row.budgeted_children = self.format_amount(
+                    self._only_position(period_data.subtree_total(a, 'budgeted')), show_if_zero=True)
+
+                available = self._value(account_row.available)
+                row.has_available = bool(available)
+                row.available_children = self.format_amount(
+                    self._only_position(period_data.subtree_total(a, 'available')))
+                row.is_leaf = period_data.is_leaf(a)
+                if row.is_leaf:
+                    row.available = self.format_amount(available, show_if_zero=True)
+                    row.available_class = 'negative' if available.number < 0 else \
+                        'underfunded' if account_row.is_underfunded else \
+                        'positive' if available.number > 0 else 'zero'
+                    if not row.is_real_account and account_row.has_any_goal and available.number >= 0:
+                        row.funding = 'funded' if account_row.is_funded else \
+                            'underfunded' if account_row.is_underfunded else None
+            rows.append(row)
+
+        def walk(accounts, depth):
+            for a in accounts:
+                children = visible(a.values())
+                add(a, depth, children)
+                walk(sorted(children, key=self._ordering), depth + 1)
+                rows[-1].close += 1
+
+        walk(visible(period_data.accounts), 0)
+        return tuple(rows)
+
+    @extension_endpoint('period')
+    def period_json(self):
+        """The summary and the row tree of a period as JSON, e.g. for dashboards polling the budget.
+
+        Takes the same `period`, `budget` and `show_accounts` arguments as the page. The ETag only
+        changes with the loaded ledger, so a conditional request is answered without computing anything.
+        """
+        period = request.args.get('period') or self._period_for(datetime.date.today())
+        budget = request.args.get('budget') or None
+        show_real = request.args.get('show_accounts') == 'True'
+
+        if not PERIOD.fullmatch(period):
+            abort(400, f"invalid period: {period}, expected YYYY-MM")
+        if budget is not None and budget not in self.get_budgets():
+            abort(404, f"unknown budget: {budget}")
+
+        etag = hashlib.sha1(repr((self._cache_key(budget), period, show_real)).encode()).hexdigest()
+        self._used = True
+        if etag in request.if_none_match:
+            response = Response(status=304)
+        else:
+            envelopes = self._compute_budget(budget)
+            if period not in set(envelopes.get_budgets_months_available()):
+                abort(404, f"no budget for period: {period}")
+            response = jsonify(self._period_json(envelopes, period, show_real))
+        response.set_etag(etag)
+        return response
+
+    def _period_json(self, envelopes, period, show_real):
+        from envelope_budget.modules.envelope_extension import TOTAL_COLUMNS
+
+        summary = envelopes.get_summary(period)
+        period_data = envelopes.get_inventories(period, show_real)
+
+        def amount(inventory):
+            return self._only_position(inventory).number
+
+        def node(a):
+            account_row = period_data.account_row(a)
+            return {
+                'account': a.account,
+                'name': self._name(a),
+                'is_bucket': account_row.is_bucket,
+                'is_real_account': self._is_real_account(a),
+                'goal': amount(account_row.display_goal.amount),
+                'budgeted': amount(account_row.budgeted),
+                'spent': amount(account_row.spent),
+                'available': amount(account_row.available),
+                'totals': {column: amount(period_data.subtree_total(a, column)) for column in TOTAL_COLUMNS},
+                'children': [node(c) for c in sorted(visible(a.values()), key=self._ordering)],
+            }
+
+        def visible(accounts):
+            return [a for a in accounts if period_data.is_visible(a, show_real=show_real)]
+
+        return {
+            'period': period,
+            'is_current': period == envelopes.current_month if envelopes.initialized else False,
+            'summary': {name: getattr(summary, name) for name in SUMMARY_FIELDS},
+            'rows': [node(a) for a in visible(period_data.accounts)],
+        }
+
     def format_signed(self, value, show_if_zero=True):
         if not value and not show_if_zero:
             return ''
@@ -194,14 +567,7 @@ def _value(self, inventory: Inventory):
         return self._only_position(inventory)
 
     def _row_children(self, rows, a):
-        sum = Inventory()
-        all_matching = self.period_data.get_matching_rows(a)
-        for sub in all_matching:
-            item = sub.get(rows)
-            if isinstance(item, Target):
-                item = item.amount
-            sum.add_inventory(item)
-        return self._only_position(sum.reduce(convert.get_weight))
+        return self._only_position(self.period_data.subtree_total(a, rows))
 
     def _is_leaf(self, a):
         return self.period_data.is_leaf(a)
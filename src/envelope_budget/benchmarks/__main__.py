@@ -0,0 +1,3 @@
+from envelope_budget.benchmarks.run import main
+
+main()
@@ -0,0 +1,157 @@
+import datetime
+import random
+
+from dateutil.relativedelta import relativedelta
+
+
+class LedgerParameters:
+    """The shape of a synthetic ledger.
+
+    `accounts` expense accounts are spread over `envelopes` groups; the first
+    `mapping_rules` groups are mapped to a single envelope by a mapping rule, the
+    accounts of the other groups are envelopes of their own. Roughly every
+    tenth expense in a foreign currency (`currencies[1:]`) is paid at a price.
+    """
+
+    def __init__(self, years=8, start_year=2015, accounts=60, envelopes=15, mapping_rules=10,
+                 currencies=('EUR', 'USD'), transactions_per_month=30, allocate=True, targets=5, spending=10,
+                 seed=1):
+        self.years = years
+        self.start_year = start_year
+        self.accounts = accounts
+        self.envelopes = envelopes
+        self.mapping_rules = mapping_rules
+        self.currencies = tuple(currencies)
+        self.transactions_per_month = transactions_per_month
+        self.allocate = allocate
+        self.targets = targets
+        self.spending = spending
+        self.seed = seed
+
+    @property
+    def currency(self):
+        return self.currencies[0]
+
+    @property
+    def start_date(self):
+        return datetime.date(self.start_year, 1, 1)
+
+    @property
+    def end_date(self):
+        return datetime.date(self.start_year + self.years, 1, 1) - datetime.timedelta(days=1)
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+# from about the size of example.beancount up to ~1M postings
+PRESETS = {
+    'example': LedgerParameters(),
+    'medium': LedgerParameters(years=10, accounts=300, envelopes=60, mapping_rules=40,
+                               currencies=('EUR', 'USD', 'CHF'), transactions_per_month=400, targets=20, spending=40),
+    'large': LedgerParameters(years=15, accounts=800, envelopes=150, mapping_rules=100,
+                              currencies=('EUR', 'USD', 'CHF', 'GBP'), transactions_per_month=2800, targets=50,
+                              spending=100),
+}
+
+
+def _group(index):
+    return f'Expenses:Group{index:03d}'
+
+
+def _account(params, index):
+    return f'{_group(index % params.envelopes)}:Item{index:04d}'
+
+
+def _envelope(params, account_index):
+    group = account_index % params.envelopes
+    return _group(group) if group < params.mapping_rules else _account(params, account_index)
+
+
+def _months(params):
+    month = params.start_date
+    while month <= params.end_date:
+        yield month
+        month += relativedelta(months=1)
+
+
+def generate_ledger(params: LedgerParameters) -> str:
+    """A beancount ledger of the given shape; the same parameters always give the same ledger."""
+    rng = random.Random(params.seed)
+    currency = params.currency
+    start = params.start_date
+    lines = [
+        f'option "operating_currency" "{currency}"',
+        '',
+        f'{start} custom "fava-extension" "envelope_budget" "{{\'start\': \'{start}\', \'future_months\': 1, '
+        f'\'future_rollover\': True, \'budgets\': {{\'main\': (\'\', \'{currency}\')}}}}"',
+        '',
+    ]
+
+    for name in ['Assets:Checking', 'Assets:Savings', 'Liabilities:CreditCard', 'Income:Salary', 'Income:Other']:
+        lines.append(f'{start} open {name}')
+    for index in range(params.accounts):
+        lines.append(f'{start} open {_account(params, index)}')
+    for other in params.currencies[1:]:
+        lines.append(f'{start} commodity {other}')
+    lines.append('')
+
+    lines.append(f'{start} custom "envelope" "budget account" "Assets:Checking"')
+    lines.append(f'{start} custom "envelope" "budget account" "Liabilities:.*"')
+    lines.append(f'{start} custom "envelope" "income account" "Income:Other"')
+    for group in range(min(params.mapping_rules, params.envelopes)):
+        lines.append(f'{start} custom "envelope" "mapping" "{_group(group)}:.*" "{_group(group)}"')
+    lines.append('')
+
+    envelopes = sorted({_envelope(params, index) for index in range(params.accounts)})
+    for index in range(params.targets):
+        envelope = envelopes[index % len(envelopes)]
+        if index % 2 == 0:
+            lines.append(f'{start} custom "envelope" "target" {envelope} {rng.randint(5, 50) * 100} {currency} '
+                         f'"by" {datetime.date(params.start_year + params.years - 1, 12, 1)}')
+        else:
+            lines.append(f'{start} custom "envelope" "target" {envelope} "monthly" {rng.randint(1, 20) * 10} '
+                         f'{currency}')
+    frequencies = ['daily', 'weekly', 'monthly', 'quarterly', 'yearly']
+    for index in range(params.spending):
+        account = _account(params, index % params.accounts)
+        lines.append(f'{start} custom "envelope" "spending" {account} "{frequencies[index % len(frequencies)]}" '
+                     f'{rng.randint(100, 20000) / 100:.2f} {currency}')
+    lines.append('')
+
+    for month in _months(params):
+        days = (month + relativedelta(months=1) - month).days
+
+        for other in params.currencies[1:]:
+            lines.append(f'{month} price {other} {rng.uniform(0.5, 1.5):.4f} {currency}')
+
+        lines.append(f'{month} * "Salary"')
+        lines.append(f'  Income:Salary  -{rng.randint(2000, 6000)}.00 {currency}')
+        lines.append('  Assets:Checking')
+        lines.append('')
+
+        if params.allocate:
+            for envelope in envelopes:
+                lines.append(f'{month} custom "envelope" "allocate" "{envelope}" {rng.randint(0, 400)}.00')
+            lines.append('')
+
+        for day in sorted(rng.randrange(days) for _ in range(params.transactions_per_month)):
+            date = month + datetime.timedelta(days=day)
+            account = _account(params, rng.randrange(params.accounts))
+            source = 'Assets:Checking' if rng.random() < 0.6 else 'Liabilities:CreditCard'
+            amount = rng.randint(100, 20000) / 100
+            lines.append(f'{date} * "Payee {rng.randrange(200)}" "Expense"')
+            if len(params.currencies) > 1 and rng.random() < 0.1:
+                other = params.currencies[1 + rng.randrange(len(params.currencies) - 1)]
+                lines.append(f'  {account}  {amount:.2f} {other} @ {rng.uniform(0.5, 1.5):.4f} {currency}')
+            else:
+                lines.append(f'  {account}  {amount:.2f} {currency}')
+            lines.append(f'  {source}')
+            lines.append('')
+
+        lines.append(f'{month + datetime.timedelta(days=days - 1)} * "Refund"')
+        lines.append(f'  Income:Other  -{rng.randint(1, 100)}.00 {currency}')
+        lines.append('  Assets:Checking')
+        lines.append('')
+
+    return '\n'.join(lines)
@@ -0,0 +1,144 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from importlib import metadata
+
+from fava.core import FavaLedger
+
+from envelope_budget.benchmarks.ledger_generator import PRESETS, generate_ledger
+from envelope_budget.modules.beancount_envelope import BeancountEnvelope
+from envelope_budget.modules.envelope_extension import EnvelopeWrapper
+from envelope_budget.modules.hierarchy.beancount_entries import TransactionParser
+from envelope_budget.modules.ledger_context import LedgerContext
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def _summary(runs):
+    return {'min': min(runs), 'median': statistics.median(runs), 'max': max(runs), 'runs': runs}
+
+
+def _versions():
+    versions = {'python': platform.python_version()}
+    for package in ['beancount', 'fava', 'pandas', 'numpy']:
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            versions[package] = None
+    return versions
+
+
+def _module(context, params):
+    return BeancountEnvelope(context, '', params.start_date, today=params.end_date)
+
+
+def _envelope_tables(context, params):
+    module = _module(context, params)
+    parser = TransactionParser(module.context, currency=module.currency, budget_accounts=module.budget_accounts,
+                               mappings=module.mappings, classifier=module.classifier)
+    return _timed(lambda: module.envelope_tables(parser))[0]
+
+
+def _make_table(ledger, ext, period):
+    seconds = _timed(lambda: ext.make_table(period, 'True', None))[0]
+    # the extension reports a failed render as an error of the ledger, not by raising
+    errors = [e for e in ledger.errors if type(e).__name__ == 'LoadError']
+    if errors:
+        raise RuntimeError(errors[0].message)
+    return seconds
+
+
+def run_benchmarks(params, repeat=3):
+    """Time the stages of the budget for a generated ledger, returns a JSON serializable dict."""
+    fd, filename = tempfile.mkstemp(suffix='.beancount')
+    with os.fdopen(fd, 'w') as f:
+        f.write(generate_ledger(params))
+
+    try:
+        load, ledger = _timed(lambda: FavaLedger(filename))
+        transactions = ledger.all_entries_by_type.Transaction
+        context = LedgerContext.from_fava(ledger)
+
+        timings = dict()
+        timings['envelope_tables'] = _summary([_envelope_tables(context, params) for _ in range(repeat)])
+
+        wrappers = [_timed(lambda: EnvelopeWrapper(_module(context, params))) for _ in range(repeat)]
+        timings['wrapper_init'] = _summary([t for t, _ in wrappers])
+
+        wrapper = wrappers[-1][1]
+        periods = list(wrapper.get_budgets_months_available())
+        inventories = [sum(_timed(lambda: wrapper.get_inventories(p, True))[0] for p in periods)
+                       for _ in range(repeat)]
+        timings['get_inventories'] = _summary([t / len(periods) for t in inventories])
+        timings['get_inventories_all_periods'] = _summary(inventories)
+
+        ext = ledger.extensions.get_extension('EnvelopeBudgetColor')
+        config = ext.config
+        # a warm-up after the reload would compute the budget while (or before) the cold render is timed
+        ext.config = dict(config, warm_up=False)
+        cold, warm = [], []
+        for _ in range(repeat):
+            ext.after_load_file()
+            cold.append(_make_table(ledger, ext, periods[-1]))
+            warm.append(_make_table(ledger, ext, periods[0]))
+        timings['make_table'] = _summary(cold)
+        timings['make_table_cached'] = _summary(warm)
+
+        ext.config = dict(config, warm_up=True)
+        warm_up = []
+        for _ in range(repeat):
+            ext.after_load_file()
+            warm_up.append(_timed(ext.warm_up.result)[0])
+        timings['warm_up'] = _summary(warm_up)
+        ext.config = config
+
+        return {
+            'parameters': params.as_dict(),
+            'ledger': {
+                'transactions': len(transactions),
+                'postings': sum(len(e.postings) for e in transactions),
+                'custom': len(ledger.all_entries_by_type.Custom),
+                'periods': len(periods),
+                'load': load,
+            },
+            'timings': timings,
+            'versions': _versions(),
+        }
+    finally:
+        os.remove(filename)
+
+
+def main():
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)-8s: %(message)s')
+    parser = argparse.ArgumentParser(description="fava-envelope benchmarks")
+    parser.add_argument('--preset', choices=sorted(PRESETS), nargs='+', default=['example'], dest='presets',
+                        help='ledger sizes to benchmark')
+    parser.add_argument('--repeat', type=int, default=3, help='number of runs per stage')
+    parser.add_argument('--output', help='write the JSON results to this file instead of stdout')
+    args = parser.parse_args()
+
+    results = dict()
+    for preset in args.presets:
+        logging.warning(f"benchmarking preset '{preset}'")
+        results[preset] = run_benchmarks(PRESETS[preset], args.repeat)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+import argparse
+import ast
+import datetime
+import logging
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from beancount import loader
+
+from envelope_budget.modules.beancount_envelope import BeancountEnvelope, budget_options
+from envelope_budget.modules.envelope_extension import build_wrappers, build_wrappers_in_processes
+from envelope_budget.modules.ledger_context import LedgerContext
+from envelope_budget.modules.timing import Timings, collect, span
+
+FORMATS = ('csv', 'parquet', 'json')
+
+
+def extension_config(context):
+    """The config of the extension from the ledger's `fava-extension` entry (as fava reads it)."""
+    for e in context.custom_of_type('fava-extension', 'envelope_budget'):
+        return ast.literal_eval(e.values[1].value) if len(e.values) > 1 else dict()
+    return dict()
+
+
+def budget_tables(wrapper):
+    """The income summary, the envelopes and the account activity of a budget, one row per month (and row)."""
+    numeric = wrapper.numeric
+    income = numeric.decimals(wrapper.income_tables).T
+    income.index.name = 'month'
+
+    envelopes = numeric.decimals(wrapper.bucket_data).stack(level=0)
+    envelopes.index.names = ['bucket', 'month']
+
+    activity = wrapper.account_data.stack(level=0)
+    activity.index.names = ['bucket', 'account', 'month']
+    activity['activity'] = numeric.decimals(activity['activity'])
+
+    return {'income': income, 'envelopes': envelopes, 'activity': activity}
+
+
+def write_table(df, path, fmt):
+    if fmt == 'csv':
+        df.to_csv(path)
+    elif fmt == 'parquet':
+        df.to_parquet(path)
+    else:
+        df.reset_index().to_json(path, orient='records', date_format='iso', default_handler=str)
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.WARNING, format='%(levelname)-8s: %(message)s')
+    parser = argparse.ArgumentParser(prog='fava-envelope',
+                                     description="export the envelope budgets of a beancount ledger")
+    parser.add_argument('filename', help='path to the beancount ledger')
+    parser.add_argument('--budget', action='append', dest='budgets',
+                        help='only export this configured budget (repeatable), default: all')
+    parser.add_argument('--format', choices=FORMATS, default='csv', help='output format (default: csv)')
+    parser.add_argument('--output', default='.', help='directory the tables are written to (default: .)')
+    parser.add_argument('--start', help='first month of the budget (YYYY-MM-DD), default: from the config')
+    parser.add_argument('--today', type=datetime.date.fromisoformat,
+                        help='compute the budget as of this date (YYYY-MM-DD), default: today')
+    parser.add_argument('--workers', type=int, default=1, help='compute the budgets in this many processes')
+    parser.add_argument('--timings', action='store_true', help='report the time of each stage on stderr')
+    args = parser.parse_args(argv)
+
+    timings = Timings() if args.timings else None
+    with collect(timings):
+        export(parser, args)
+
+    if timings is not None:
+        print(timings, file=sys.stderr)
+        print(f"total {timings.total * 1000:.1f} ms", file=sys.stderr)
+
+
+def export(parser, args):
+    with span('load'):
+        entries, errors, options_map = loader.load_file(args.filename)
+    context = LedgerContext(entries, errors, options_map)
+
+    config = extension_config(context)
+    if args.start:
+        config['start'] = args.start
+    budgets = config.get('budgets') or {'envelope': ('',)}
+    names = args.budgets or list(budgets)
+    unknown = [name for name in names if name not in budgets]
+    if unknown:
+        parser.error(f"unknown budget(s): {', '.join(unknown)}, configured are: {', '.join(budgets)}")
+
+    options = budget_options(config, args.today)
+    postfixes = [budgets[name][0] for name in names]
+
+    if args.workers > 1 and len(names) > 1:
+        with ProcessPoolExecutor(max_workers=args.workers) as executor, span('compute'):
+            wrappers = build_wrappers_in_processes(executor, context, [(postfix, options) for postfix in postfixes])
+    else:
+        with span('compute'):
+            modules = [BeancountEnvelope(context, postfix, **options) for postfix in postfixes]
+            wrappers = build_wrappers(modules)
+
+    os.makedirs(args.output, exist_ok=True)
+    for name, wrapper in zip(names, wrappers):
+        with span('tables'):
+            tables = budget_tables(wrapper)
+        for table, df in tables.items():
+            path = os.path.join(args.output, f"{name}-{table}.{args.format}")
+            try:
+                with span('write'):
+                    write_table(df, path, args.format)
+            except ImportError as e:
+                parser.error(f"writing {args.format} needs an optional dependency: {e}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,34 +1,33 @@
 import re
 from typing import List
 
-from beancount.core.data import Custom, Entries
+from beancount.core.data import Entries
+
+from envelope_budget.modules.hierarchy.account_classifier import AccountClassifier
+from envelope_budget.modules.ledger_context import LedgerContext
 
 
 def map_accounts_to_buckets(accounts: List[str], mappings: List,
                             fallback_mapping: str = None) -> List[str]:
 
-    def get_bucket(mappings, account, fallback_value: str = None) -> str:
-        for regexp, target_account in mappings:
-            if regexp.match(account):
-                return target_account
+    classifier = AccountClassifier.of(mappings)
+
+    def get_bucket(account, fallback_value: str = None) -> str:
+        bucket = classifier.bucket_or_none(account)
+        if bucket is not None:
+            return bucket
 
         return fallback_value if not None else account
 
-    return [get_bucket(mappings, a, fallback_mapping) for a in accounts]
+    return [get_bucket(a, fallback_mapping) for a in accounts]
+
+
 
+def retrieve_mappings(context: LedgerContext, entrytype: str):
+    """The (pattern, bucket) mappings of a budget, from the custom entry index of the ledger."""
+    return [(re.compile(e.values[1].value), e.values[2].value)
+            for e in context.custom_of_type(entrytype, "mapping")]
 
 
 def retrieve_mappings_from_entries(entries: Entries, entrytype: str):
-    mappings = []
-
-    for e in entries:
-        if isinstance(e, Custom) and e.type == entrytype:
-            type = e.values[0].value
-            if type == "mapping":
-                map_set = (
-                    re.compile(e.values[1].value),
-                    e.values[2].value
-                )
-                mappings.append(map_set)
-
-    return mappings
+    return retrieve_mappings(LedgerContext(entries, [], dict()), entrytype)
@@ -0,0 +1,101 @@
+import bisect
+import datetime
+
+from beancount.core import convert
+from beancount.core.inventory import Inventory
+from beancount.core.number import Decimal
+
+
+def _month_start(date):
+    return datetime.date(date.year, date.month, 1)
+
+
+class BalanceIndex:
+    """Balances of the budget accounts at every month boundary.
+
+    Built in one pass over the (date sorted) transactions. The balance before
+    the first day of a month is a stored snapshot; for any other date only the
+    postings of that month up to the date are added.
+
+    Converted balances are rounded to the display precision of the currency
+    (`dformat`), as the numbers of a BQL query are.
+    """
+
+    def __init__(self, transactions, is_budget_account, price_map, dformat=None):
+        self.price_map = price_map
+        self.dformat = dformat
+        self._months = []
+        self._snapshots = []
+        self._postings = []
+        self._converted = dict()
+
+        balances = dict()
+        snapshot = dict()
+        changed = set()
+
+        for entry in transactions:
+            for posting in entry.postings:
+                account = posting.account
+                if not is_budget_account(account):
+                    continue
+
+                month = _month_start(entry.date)
+                if not self._months or self._months[-1] != month:
+                    snapshot = self._snapshot(snapshot, balances, changed)
+                    self._months.append(month)
+                    self._snapshots.append(snapshot)
+                    self._postings.append([])
+
+                balances.setdefault(account, Inventory()).add_position(posting)
+                changed.add(account)
+                self._postings[-1].append((entry.date, posting))
+
+        self._final = self._snapshot(snapshot, balances, changed)
+
+    @staticmethod
+    def _snapshot(previous, balances, changed):
+        snapshot = dict(previous)
+        for account in changed:
+            snapshot[account] = Inventory(balances[account])
+        changed.clear()
+        return snapshot
+
+    def inventories(self, date):
+        """The balance of each budget account with all postings before `date`."""
+        index = bisect.bisect_right(self._months, date) - 1
+        if index < 0:
+            return dict()
+
+        month = self._months[index]
+        if date == month:
+            return self._snapshots[index]
+
+        next_month = datetime.date(month.year + month.month // 12, month.month % 12 + 1, 1)
+        if date >= next_month:
+            return self._snapshots[index + 1] if index + 1 < len(self._snapshots) else self._final
+
+        balances = {account: Inventory(balance) for account, balance in self._snapshots[index].items()}
+        for posting_date, posting in self._postings[index]:
+            if posting_date >= date:
+                break
+            balances.setdefault(posting.account, Inventory()).add_position(posting)
+        return balances
+
+    def balances(self, date, currency):
+        """The non-zero balance of each budget account before `date`, in `currency` at the latest price."""
+        key = (date, currency)
+        converted = self._converted.get(key)
+        if converted is None:
+            converted = dict()
+            for account, balance in sorted(self.inventories(date).items()):
+                balance = balance.reduce(convert.convert_position, currency, self.price_map, None)
+                number = balance.get_currency_units(currency).number
+                if number and self.dformat:
+                    number = self.dformat.quantize(number, currency)
+                if number:
+                    converted[account] = number
+            self._converted[key] = converted
+        return converted
+
+    def total(self, date, currency):
+        return sum(self.balances(date, currency).values(), Decimal(0.0))
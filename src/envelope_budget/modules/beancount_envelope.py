@@ -1,45 +1,63 @@
-# Debug
-try:
-    import ipdb
-except ImportError:
-    pass
-
 import datetime
 import collections
 import logging
+import numpy as np
 import pandas as pd
 import re
 from dateutil.relativedelta import relativedelta
 
 from beancount.core.number import Decimal
 from beancount.core import data
-from beancount.core import prices, inventory, convert
-from beancount.core import account_types
+from beancount.core import inventory, convert
 from beancount.core import amount
-from beancount.query import query
-from beancount.core.data import Custom
-from beancount.parser import options
+from beancount.core.display_context import Precision
+
+from envelope_budget.modules.hierarchy.account_classifier import AccountClassifier
+from envelope_budget.modules.numeric import get_backend
+from envelope_budget.modules.rollover import rollover_available, overspent
+from envelope_budget.modules.timing import span
 
 BudgetError = collections.namedtuple('BudgetError', 'source message entry')
 
 
+def _first_change(previous, current):
+    """The index of the first month (column) that differs, or the number of months if none does."""
+    changed = np.flatnonzero(~(previous == current).all(axis=0))
+    return changed[0] if len(changed) else current.shape[1]
+
+
+def budget_options(config, today=None):
+    """The keyword arguments of BeancountEnvelope from the extension config, shared by fava and the CLI."""
+    start_date = config.get('start')
+    return dict(start_date=datetime.date.fromisoformat(start_date) if start_date is not None else None,
+                future_months=config.get('future_months', 1),
+                future_rollover=config.get('future_rollover', True),
+                show_real_accounts=config.get('show_real_accounts'),
+                numeric_backend=config.get('numeric_backend'),
+                today=today)
+
+
 class BeancountEnvelope:
 
-    def __init__(self, entries, errors, options_map, budget_postfix,
+    def __init__(self, context, budget_postfix,
                  start_date=None, future_months=1, future_rollover=True,
-                 show_real_accounts=True, today=None):
+                 show_real_accounts=True, today=None, numeric_backend=None, contributions=None):
 
-        self.entries = entries
-        self.errors = errors
-        self.options_map = options_map
-        self.currency = self._find_currency(options_map)
+        self.context = context
+        self.entries = context.entries
+        self.errors = context.errors
+        self.options_map = context.options_map
+        self.currency = self._find_currency(self.options_map)
         self.customentry = "envelope" + budget_postfix if budget_postfix else "envelope"
-        (self.budget_accounts, self.mappings, max_date, self.income_accounts, self.allocation_entries,
-         self.target_entries) = self._find_envelop_settings()
+        with span('settings'):
+            (self.budget_accounts, self.mappings, max_date, self.income_accounts,
+             self.allocation_entries) = self._find_envelop_settings()
         self.show_real_accounts = show_real_accounts
 
         decimal_precison = '0.00'
         self.Q = Decimal(decimal_precison)
+        self.numeric = get_backend(numeric_backend, self._currency_quantum())
+        self.contributions = contributions
 
         # Compute start of period
         # TODO get start date from journal
@@ -52,8 +70,9 @@ def __init__(self, entries, errors, options_map, budget_postfix,
         self.date_end = max_date + relativedelta(months=future_months)
         self.future_rollover = future_rollover
 
-        self.price_map = prices.build_price_map(entries)
-        self.acctypes = options.get_account_types(options_map)
+        self.price_map = context.price_map
+        self.acctypes = context.acctypes
+        self.classifier = AccountClassifier(self.budget_accounts, self.mappings, self.income_accounts, self.acctypes)
 
     def _find_currency(self, options_map):
         default_currency = 'USD'
@@ -65,35 +84,25 @@ def _find_currency(self, options_map):
         logging.warning(f"invalid operating currency: {currency}, defaulting to {default_currency}")
         return default_currency
 
+    def _currency_quantum(self):
+        """The quantum of the budget currency: its display precision, but at least cents (see self.Q)."""
+        dcontext = self.options_map.get('dcontext')
+        fractional = dcontext.ccontexts[self.currency].get_fractional(Precision.MOST_COMMON) if dcontext else None
+        places = max(-self.Q.as_tuple().exponent, fractional or 0)
+        return Decimal(1).scaleb(-places)
+
+    def settings(self, kind):
+        """The custom entries of this budget of one kind (e.g. "mapping"), from the index of the ledger."""
+        return self.context.custom_of_type(self.customentry, kind)
+
     def _find_envelop_settings(self):
-        budget_accounts= []
-        mappings = []
-        income_accounts = []
-        target_entries = []
-        allocation_entries = []
-
-        allocation_dates = set()
-
-        for e in self.entries:
-            if isinstance(e, Custom) and e.type == self.customentry:
-                type = e.values[0].value
-                if type == "budget account":
-                    budget_accounts.append(re.compile(e.values[1].value))
-                elif type == "mapping":
-                    map_set = (
-                        re.compile(e.values[1].value),
-                        e.values[2].value
-                    )
-                    mappings.append(map_set)
-                elif type == "allocate":
-                    allocation_dates.add(e.date)
-                    allocation_entries.append(e)
-                elif type == "currency":
-                    self.currency = e.values[1].value
-                elif type == "income account":
-                    income_accounts.append(re.compile(e.values[1].value))
-                elif type == "target" or type == "spending":
-                    target_entries.append(e)
+        budget_accounts = [re.compile(e.values[1].value) for e in self.settings("budget account")]
+        mappings = [(re.compile(e.values[1].value), e.values[2].value) for e in self.settings("mapping")]
+        income_accounts = [re.compile(e.values[1].value) for e in self.settings("income account")]
+        allocation_entries = list(self.settings("allocate"))
+        allocation_dates = set(e.date for e in allocation_entries)
+        for e in self.settings("currency"):
+            self.currency = e.values[1].value
 
         if len(allocation_dates) == 0:
             logging.warning("No envelope entries found")
@@ -105,9 +114,10 @@ def _find_envelop_settings(self):
             logging.warning('no budget accounts setup within given time range.')
             #self.errors.append(BudgetError(data.new_metadata("<fava-envelope>", 0), 'no budget accounts setup', None))
 
-        return budget_accounts, mappings, max_date, income_accounts, allocation_entries, target_entries
+        return budget_accounts, mappings, max_date, income_accounts, allocation_entries
 
-    def envelope_tables(self, entry_parser=None):
+    def envelope_tables(self, entry_parser=None, actual_expenses=None):
+        """The budget tables; `actual_expenses` is the activity the parser computed already (see parse_all_transactions)."""
 
         months = []
         date_current = self.date_start
@@ -135,62 +145,57 @@ def envelope_tables(self, entry_parser=None):
         self.envelope_df = pd.DataFrame(columns=column_index)
         self.envelope_df.index.name = "Envelopes"
 
-        if entry_parser is not None:
-            self.actual_expenses = entry_parser.parse_transactions(start=self.date_start, end=self.date_end,
-                                                                   income_accounts=self.income_accounts)
-            self._calculate_budget_activity_from_actual(self.actual_expenses)
-        else:
-            self._calculate_budget_activity()
-            self.actual_expenses = pd.DataFrame()
+        with span('activity'):
+            if entry_parser is not None:
+                if actual_expenses is None:
+                    actual_expenses = entry_parser.parse_transactions(start=self.date_start, end=self.date_end,
+                                                                      income_accounts=self.income_accounts)
+                self.actual_expenses = actual_expenses
+                self._calculate_budget_activity_from_actual(self.actual_expenses)
+            else:
+                self._calculate_budget_activity()
+                self.actual_expenses = pd.DataFrame()
 
-        self._calc_budget_budgeted()
+        with span('budgeted'):
+            self._calc_budget_budgeted()
 
         income_df_detail = pd.DataFrame(data=self.income_df)
         income_df_detail = income_df_detail.rename(index={'Avail Income': "Income"})
 
         # Calculate Starting Balance Income
-        starting_balance = Decimal(0.0)
-        query_str = f"select account, convert(sum(position),'{self.currency}') from close on {months[0]}-01 group by 1 order by 1;"
-        rows = query.run_query(self.entries, self.options_map, query_str, numberify=True)
-
-        for row in rows[1]:
-            if any(regexp.match(row[0]) for regexp in self.budget_accounts):
-                if row[1] is not None:
-                    starting_balance += row[1]
+        with span('opening balance'):
+            starting_balance = self.context.balance_index(self.classifier).total(
+                datetime.date.fromisoformat(f"{months[0]}-01"), self.currency)
 
         self.income_df[months[0]]["Avail Income"] += starting_balance
-        self.envelope_df.fillna(Decimal(0.00), inplace=True)
+
+        # finer than the currency if e.g. an allocation has more digits
+        numeric = self.numeric = self.numeric.for_values(self.income_df, income_df_detail, self.envelope_df,
+                                                         self.actual_expenses)
+        self.income_df = numeric.from_decimals(self.income_df)
+        income_df_detail = numeric.from_decimals(income_df_detail)
+        self.envelope_df = numeric.from_decimals(self.envelope_df)
+        self.actual_expenses = numeric.from_decimals(self.actual_expenses)
+        starting_balance = numeric.from_decimal(starting_balance)
 
         curr_month_index = months.index(self.current_month)
         max_index = len(months) if self.future_rollover else curr_month_index
 
         # Set available
-        for index, row in self.envelope_df.iterrows():
-            for index2, month in enumerate(months):
-                if index2 == 0:
-                    row[month, 'available'] = row[month, 'budgeted'] + row[month, 'activity']
-                else:
-                    prev_available = row[months[index2-1],'available']
-                    rollover = index2 <= max_index
-                    if rollover and prev_available > 0:
-                        row[month, 'available'] = prev_available + row[month, 'budgeted'] + row[month, 'activity']
-                    else:
-                        row[month, 'available'] = row[month, 'budgeted'] + row[month, 'activity']
+        budgeted = self.envelope_df.xs('budgeted', level=1, axis=1)[months].to_numpy()
+        activity = self.envelope_df.xs('activity', level=1, axis=1)[months].to_numpy()
+        store = self.contributions if entry_parser is not None else None
+        with span('rollover'):
+            available = self._rollover_available(store, months, budgeted, activity, max_index)
+        for index, month in enumerate(months):
+            self.envelope_df[month, 'available'] = available[:, index]
 
         # Set overspent
-        for index, month in enumerate(months):
-            if index == 0:
-                self.income_df.loc["Overspent", month] = Decimal(0.00)
-            else:
-                overspent = Decimal(0.00)
-                for index2, row in self.envelope_df.iterrows():
-                    if row[months[index-1],'available'] < Decimal(0.00):
-                        overspent += Decimal(row[months[index-1], 'available'])
-                self.income_df.loc["Overspent", month] = overspent
+        self.income_df.loc["Overspent"] = pd.Series(overspent(available), index=months)
 
         # Set Budgeted for month
         for month in months:
-            self.income_df.loc["Budgeted",month] = Decimal(-1 * self.envelope_df[month,'budgeted'].sum())
+            self.income_df.loc["Budgeted",month] = numeric.scalar(-1 * self.envelope_df[month,'budgeted'].sum())
 
         # Adjust Avail Income
         for index, month in enumerate(months):
@@ -213,12 +218,12 @@ def envelope_tables(self, entry_parser=None):
         spent = self.income_df.filter(items=['Overspent', 'Budgeted'], axis=0).sum(axis=0, numeric_only=False)
         spent_next_month = spent.shift(-1).fillna(0)
         all_future_spending = spent_next_month.loc[::-1].cumsum().loc[::-1]
-        future_delta = all_future_spending.add(remaining[all_future_spending < 0], fill_value=Decimal(0))
+        future_delta = all_future_spending.add(remaining[all_future_spending < 0], fill_value=numeric.zero)
         max_future_spending = all_future_spending - future_delta
 
-        future_budget = max_future_spending[future_delta < 0].add(all_future_spending[future_delta >= 0], fill_value=Decimal(0))
+        future_budget = max_future_spending[future_delta < 0].add(all_future_spending[future_delta >= 0], fill_value=numeric.zero)
         future_budget = future_budget[remaining > 0]
-        tbb = remaining.add(future_budget, fill_value=Decimal(0))
+        tbb = remaining.add(future_budget, fill_value=numeric.zero)
 
         cover_next_month = remaining[remaining >= 0] + spent_next_month
         stealing = cover_next_month[cover_next_month < 0]
@@ -227,19 +232,41 @@ def envelope_tables(self, entry_parser=None):
         self.income_df.loc['Budgeted Future'] = future_budget
         income_df_detail.loc['Stealing from Future'] = stealing
 
-        summary_info = pd.concat([self.income_df, income_df_detail], axis=0).fillna(Decimal(0))
+        summary_info = numeric.fill(pd.concat([self.income_df, income_df_detail], axis=0))
         return summary_info, self.envelope_df, self.actual_expenses, self.current_month
 
     #def is_income(self, account):
     #    account_type = account_types.get_account_type(account)
     #    return account_type == self.acctypes.income
 
-    def _get_bucket(self, account):
-        for regexp, target_account in self.mappings:
-            if regexp.match(account):
-                return target_account
+    def _rollover_available(self, store, months, budgeted, activity, max_index):
+        state = (self.numeric.name, getattr(self.numeric, 'quantum', None), tuple(months), tuple(self.envelope_df.index),
+                 max_index)
+        previous, start = None, 1
+
+        # months before the first one whose budgeted amounts or activity changed keep their balances;
+        # compared to the saved inputs, as the store may have been updated by a build that never got here
+        if store is not None and store.rollover is not None and store.rollover[0] == state:
+            _, prev_budgeted, prev_activity, prev_available = store.rollover
+            start = min(_first_change(prev_budgeted, budgeted), _first_change(prev_activity, activity))
+            previous = prev_available
+
+        available = rollover_available(budgeted, activity, max_index, previous, start)
+        if store is not None:
+            store.rollover = (state, budgeted, activity, available)
+        return available
+
+    def query_account_balances(self, date):
+        """Total and per account balance of the budget accounts before the given date."""
+        if isinstance(date, str):
+            date = datetime.date.fromisoformat(date)
 
-        return account
+        balances = self.context.balance_index(self.classifier).balances(date, self.currency)
+        positions = pd.DataFrame.from_dict(balances, orient='index', columns=[self.currency])
+        return sum(balances.values(), Decimal(0.0)), positions
+
+    def _get_bucket(self, account):
+        return self.classifier.bucket(account)
 
     def _calculate_budget_activity_from_actual(self, actual_expenses: pd.DataFrame):
         buckets_only = actual_expenses.groupby(level=0, axis=0).sum(numeric_only=False)
@@ -260,36 +287,23 @@ def _calculate_budget_activity(self):
         balances = collections.defaultdict(
             lambda: collections.defaultdict(inventory.Inventory))
         all_months = set()
+        classify = self.classifier.classify
 
-        for entry in data.filter_txns(self.entries):
-
-            # Check entry in date range
-            if entry.date < self.date_start or entry.date > self.date_end:
-                continue
+        for entry in self.context.transactions_between(self.date_start, self.date_end):
 
             month = (entry.date.year, entry.date.month)
             # TODO domwe handle no transaction in a month?
             all_months.add(month)
 
             # TODO
-            contains_budget_accounts = False
-            for posting in entry.postings:
-                if any(regexp.match(posting.account) for regexp in self.budget_accounts):
-                    contains_budget_accounts = True
-                    break
-
-            if not contains_budget_accounts:
+            if not any(classify(p.account).is_budget_account for p in entry.postings):
                 continue
 
             for posting in entry.postings:
 
-                account = posting.account
-                for regexp, target_account in self.mappings:
-                    if regexp.match(account):
-                        account = target_account
-                        break
+                account_class = classify(posting.account)
+                account = account_class.bucket
 
-                account_type = account_types.get_account_type(account)
                 if posting.units.currency != self.currency:
                     orig=posting.units.number
                     if posting.price is not None:
@@ -298,10 +312,9 @@ def _calculate_budget_activity(self):
                     else:
                         continue
 
-                if (account_type == self.acctypes.income
-                    or (any(regexp.match(account) for regexp in self.income_accounts))):
+                if classify(account).is_income:
                     account = "Income"
-                elif any(regexp.match(posting.account) for regexp in self.budget_accounts):
+                elif account_class.is_budget_account:
                     continue
                 # TODO WARn of any assets / liabilities left
 
@@ -346,11 +359,7 @@ def _calculate_budget_activity(self):
                     self.envelope_df.loc[account,(month_str,'available')] = Decimal(0.00)
 
     def get_bucket_or_none(self, account):
-        for regexp, target_account in self.mappings:
-            if regexp.match(account):
-                return target_account
-
-        return None
+        return self.classifier.bucket_or_none(account)
 
     def _calc_budget_budgeted(self):
         for e in self.allocation_entries:
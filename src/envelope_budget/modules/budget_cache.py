@@ -0,0 +1,88 @@
+import threading
+from concurrent.futures import Future
+
+
+class BudgetCache:
+    """Computed budget results for the currently loaded ledger.
+
+    Entries are keyed on the load generation of the ledger, so a reload (which
+    bumps the generation) makes all previously computed results unreachable.
+    """
+
+    def __init__(self):
+        self.generation = 0
+        self._results = dict()
+        # the results being computed, as {key: Future}
+        self._pending = dict()
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        with self._lock:
+            self.generation += 1
+            self._results.clear()
+
+    def key(self, *parts):
+        return (self.generation,) + tuple(parts)
+
+    def get(self, key):
+        with self._lock:
+            return self._results.get(key)
+
+    def put(self, key, value):
+        with self._lock:
+            # results of an older generation must never be stored after a reload
+            if key[0] == self.generation:
+                self._results[key] = value
+
+    def get_or_compute(self, keys, compute):
+        """The result of the first of `keys`, computed if needed.
+
+        The results missing for any of `keys` are computed together by
+        `compute(missing_keys) -> {key: result}`. A result that is being
+        computed by another thread already is waited for instead.
+        """
+        key = keys[0]
+        with self._lock:
+            if key in self._results:
+                return self._results[key]
+            future = self._pending.get(key)
+            if future is None:
+                future = Future()
+                missing = [k for k in keys if k not in self._results and k not in self._pending]
+                for k in missing:
+                    self._pending[k] = future
+            else:
+                missing = None
+
+        if missing is None:
+            return future.result()[key]
+
+        try:
+            results = compute(missing)
+        except BaseException as e:
+            with self._lock:
+                self._drop_pending(missing, future)
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            for k in missing:
+                # results of an older generation must never be stored after a reload
+                if k[0] == self.generation:
+                    self._results[k] = results[k]
+            self._drop_pending(missing, future)
+        future.set_result(results)
+        return results[key]
+
+    def _drop_pending(self, keys, future):
+        for k in keys:
+            if self._pending.get(k) is future:
+                del self._pending[k]
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._results
+
+    def __len__(self):
+        with self._lock:
+            return len(self._results)
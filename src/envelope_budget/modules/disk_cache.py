@@ -0,0 +1,121 @@
+import functools
+import hashlib
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+MAX_ENTRIES = 32
+
+# the source of the budget engine, which the stored results are pickled from
+ENGINE_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+
+def source_hash(filenames):
+    """A hash of the content of the files a ledger was loaded from."""
+    digest = hashlib.sha256()
+    for filename in sorted(filenames):
+        digest.update(filename.encode())
+        with open(filename, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def engine_hash():
+    """A hash of the source of the engine, so results of another version of it are never loaded."""
+    filenames = []
+    for directory, subdirectories, files in os.walk(ENGINE_DIRECTORY):
+        subdirectories[:] = [d for d in subdirectories if d not in ('test', '__pycache__')]
+        filenames.extend(os.path.join(directory, f) for f in files if f.endswith('.py'))
+    return source_hash(filenames)
+
+
+class DiskCache:
+    """Computed budgets on disk, so a restarted (or another) fava process does not compute them again.
+
+    Each entry is a directory named by the hash of its key (which has to
+    contain everything the result depends on, e.g. the `source_hash` of the
+    ledger); entries written by another version of the engine are never read.
+    The tables with a native dtype (e.g. of the int64 backend) are stored as
+    .npy files and memory-mapped when loaded, everything else of a result
+    (all of it with Decimal tables) is pickled. Loading a pickle can run code,
+    so the directory must not be writable by anyone else. Only the
+    `MAX_ENTRIES` most recently written entries are kept.
+    """
+
+    def __init__(self, directory, tables):
+        self.directory = directory
+        self.tables = tables
+
+    def _path(self, key):
+        digest = hashlib.sha256(repr((engine_hash(),) + tuple(key)).encode()).hexdigest()
+        return os.path.join(self.directory, digest)
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(os.path.join(path, 'state.pickle'), 'rb') as f:
+                result = pickle.load(f)
+            state = result.__dict__
+            for name in self.tables:
+                if isinstance(state.get(name), _Frame):
+                    state[name] = state[name].load(path, name)
+            return result
+        except FileNotFoundError:
+            return None
+        except Exception:
+            logging.exception(f"dropping unreadable budget cache entry {path}")
+            shutil.rmtree(path, ignore_errors=True)
+            return None
+
+    def put(self, key, result):
+        path = self._path(key)
+        if os.path.exists(path):
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+        target = tempfile.mkdtemp(dir=self.directory, prefix='.tmp-')
+        try:
+            state = result.__getstate__()
+            for name in self.tables:
+                df = state.get(name)
+                if isinstance(df, pd.DataFrame) and len(set(df.dtypes)) == 1 and df.dtypes.iloc[0] != object:
+                    np.save(os.path.join(target, f'{name}.npy'), df.to_numpy())
+                    state[name] = _Frame(df.index, df.columns)
+
+            stored = object.__new__(type(result))
+            stored.__dict__.update(state)
+            with open(os.path.join(target, 'state.pickle'), 'wb') as f:
+                pickle.dump(stored, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(target, path)
+        except Exception:
+            # the cache is best effort, e.g. written by another process at the same time or a result that cannot be
+            # pickled
+            logging.warning(f"could not write budget cache entry {path}", exc_info=True)
+            shutil.rmtree(target, ignore_errors=True)
+            return
+        self._prune()
+
+    def _prune(self):
+        entries = [e for e in os.scandir(self.directory) if e.is_dir() and not e.name.startswith('.')]
+        entries.sort(key=lambda e: e.stat().st_mtime, reverse=True)
+        for e in entries[MAX_ENTRIES:]:
+            shutil.rmtree(e.path, ignore_errors=True)
+
+
+class _Frame:
+    """The index and columns of a table whose values are stored in an .npy file next to the pickle."""
+
+    def __init__(self, index, columns):
+        self.index = index
+        self.columns = columns
+
+    def load(self, path, name):
+        values = np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r')
+        return pd.DataFrame(values, index=self.index, columns=self.columns, copy=False)
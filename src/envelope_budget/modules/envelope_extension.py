@@ -1,21 +1,38 @@
+import functools
 import logging
 from decimal import Decimal
 from enum import Enum
+from types import MappingProxyType
 
+from beancount.core import convert, data
 from beancount.core.inventory import Inventory, Amount
 
 import pandas as pd
 import datetime
-from collections import defaultdict as ddict
+from collections import defaultdict as ddict, namedtuple
+from functools import cached_property
 
 from dateutil.relativedelta import relativedelta
 
 from envelope_budget.modules.beancount_envelope import BeancountEnvelope
-from envelope_budget.modules.hierarchy.beancount_entries import TransactionParser
+from envelope_budget.modules.hierarchy.beancount_entries import TransactionParser, parse_all_transactions
+from envelope_budget.modules.ledger_context import LedgerContext
 from envelope_budget.modules.hierarchy.beancount_hierarchy import Bucket, get_hierarchy, get_level_as_dict
+from envelope_budget.modules.numeric import DECIMAL
+from envelope_budget.modules.timing import span
 from envelope_budget.modules.goals.beancount_goals import EnvelopesWithGoals, merge_all_targets, get_targets
 
 
+# number of (period, show real accounts) views kept per budget
+PERIOD_CACHE_SIZE = 64
+
+# the columns of the envelope tree that are summed over subtrees
+TOTAL_COLUMNS = ('goals', 'budgeted', 'spent', 'available')
+
+BucketValues = namedtuple('BucketValues', 'activity budgeted available')
+TargetValues = namedtuple('TargetValues', 'amount ref_amount')
+
+
 def _add_amount(inventory, value, currency='EUR'):
     if not pd.isna(value) and value != 0:
         inventory.add_amount(Amount(value, currency))
@@ -70,7 +87,8 @@ def __str__(self):
 
 
 class AccountRow:
-    def __init__(self):
+    def __init__(self, numeric=DECIMAL):
+        self.numeric = numeric
         self.name: str = "<Unknown>"
         self.row_type = RowType.CONTAINER
         self.in_budget: bool = True
@@ -184,9 +202,9 @@ def set_bucket_row(self, name, e_row):
         self.name = name
         self.row_type = RowType.BUCKET
 
-        avail = e_row.available
-        budget = e_row.budgeted
-        activity = e_row.activity
+        avail = self.numeric.to_decimal(e_row.available)
+        budget = self.numeric.to_decimal(e_row.budgeted)
+        activity = self.numeric.to_decimal(e_row.activity)
 
         if pd.isna(avail) and pd.isna(budget):
             self.in_budget = False
@@ -199,7 +217,7 @@ def set_account_row(self, name, row):
         self.name = name
         self.row_type = RowType.ACCOUNT
 
-        _add_amount(self.spent, row["activity"])
+        _add_amount(self.spent, self.numeric.to_decimal(row["activity"]))
         self.goal_monthly = Target(row["goals"], goal_type='S')
 
     def get(self, name):
@@ -234,12 +252,12 @@ def get_month(date: datetime.datetime, fmt='%b'):
 
 
 class PeriodSummary:
-    def __init__(self, period, data):
+    def __init__(self, period, data, numeric=DECIMAL):
         ref_date = datetime.datetime.strptime(period, '%Y-%m')
         self.prev = get_month(ref_date - relativedelta(months=1))
         self.next = get_month(ref_date + relativedelta(months=1))
         self.month = get_month(ref_date)
-        self.data = data
+        self.data = numeric.decimals(data) if data is not None else None
 
     @property
     def to_be_budgeted(self):
@@ -303,12 +321,13 @@ def __str__(self):
 
 
 class PeriodData:
+    """The rows and the bucket hierarchy of one period; built once and shared, so it is read-only."""
+
     def __init__(self, period, account_rows, accounts, is_current_month=False):
         self.period = period
         self.is_current = is_current_month
-        self.account_rows = account_rows
-        self.accounts = accounts
-        self.accounts.sort(key=sort_buckets)
+        self.account_rows = MappingProxyType(dict(account_rows))
+        self.accounts = tuple(sorted(accounts, key=sort_buckets))
 
     @property
     def has_content(self):
@@ -318,7 +337,9 @@ def account_row(self, a):
         if isinstance(a, Bucket):
             a = a.account
 
-        return self.account_rows[a]
+        row = self.account_rows.get(a)
+        # a new one each time, as a caller may change it
+        return AccountRow() if row is None else row
 
     def is_leaf(self, acc):
         ar: AccountRow = self.account_row(acc)
@@ -335,6 +356,45 @@ def get_matching_rows(self, acc):
         matching = [self.account_rows[ar] for ar in self.account_rows.keys() if ar.startswith(a)]
         return [m for m in matching if m.is_bucket == is_bucket]
 
+    @cached_property
+    def _subtree_totals(self):
+        """(account, is_bucket) -> {column: weight} summed over the rows of the account and its descendants.
+
+        Built bottom-up once: every row adds to its own node, then every node adds to its parent.
+        """
+        totals = ddict(lambda: {name: Inventory() for name in TOTAL_COLUMNS})
+        for name, row in self.account_rows.items():
+            node = totals[(name, row.is_bucket)]
+            for column in TOTAL_COLUMNS:
+                item = row.get(column)
+                node[column].add_inventory(item.amount if isinstance(item, Target) else item)
+
+        # the parents without rows of their own
+        for name, is_bucket in list(totals.keys()):
+            while ':' in name:
+                name = name.rpartition(':')[0]
+                totals[(name, is_bucket)]
+
+        for name, is_bucket in sorted(totals.keys(), key=lambda k: k[0].count(':'), reverse=True):
+            parent = name.rpartition(':')[0]
+            if parent:
+                for column, inventory in totals[(name, is_bucket)].items():
+                    totals[(parent, is_bucket)][column].add_inventory(inventory)
+
+        return {key: {column: inventory.reduce(convert.get_weight) for column, inventory in node.items()}
+                for key, node in totals.items()}
+
+    def subtree_total(self, acc, column):
+        """The sum of a column over the bucket rows (or for real accounts the real rows) of a subtree."""
+        is_bucket = True
+        if isinstance(acc, Bucket):
+            is_bucket = not acc.is_real
+            acc = acc.account
+
+        node = self._subtree_totals.get((acc, is_bucket))
+        total = node.get(column) if node is not None else None
+        return Inventory() if total is None else total
+
     def is_visible(self, a, show_real):
         row: AccountRow = self.account_row(a)
         if row.is_bucket or (show_real and row.is_real):
@@ -343,20 +403,90 @@ def is_visible(self, a, show_real):
         return True
 
 
+class PeriodColumns:
+    """The columns of a frame with (period, ...) columns as one array, to read a period without slicing the frame."""
+
+    def __init__(self, df):
+        self.index = list(df.index)
+        self.values = df.to_numpy(dtype=object)
+        self.columns = ddict(dict)
+        for position, (period, *field) in enumerate(df.columns):
+            self.columns[period][field[0] if len(field) == 1 else tuple(field)] = position
+
+    def rows(self, period):
+        """(index, {field: value}) for every row of the period."""
+        columns = self.columns.get(period, dict())
+        fields = list(columns.keys())
+        values = self.values[:, list(columns.values())]
+        for index, row in zip(self.index, values):
+            yield index, dict(zip(fields, row))
+
+
+def _transaction_parser(module):
+    return TransactionParser(module.context,
+                             currency=module.currency,
+                             budget_accounts=module.budget_accounts,
+                             mappings=module.mappings,
+                             classifier=module.classifier,
+                             contributions=module.contributions)
+
+
+def build_wrappers(modules):
+    """The EnvelopeWrapper of each budget (module) of one ledger, with one shared pass over its transactions."""
+    with span('activity'):
+        activity = parse_all_transactions([(_transaction_parser(m), m.date_start, m.date_end, m.income_accounts)
+                                           for m in modules])
+    return [EnvelopeWrapper(m, actual_expenses) for m, actual_expenses in zip(modules, activity)]
+
+
+# the compact, picklable input of one budget computed in a worker process, see budget_input
+BudgetInput = namedtuple('BudgetInput', 'postfix entries options_map options')
+
+
+def budget_input(context, postfix, **options):
+    """The input of one budget for a worker process, with only the entries the budget reads.
+
+    Transactions without a posting to one of its budget accounts contribute
+    nothing to a budget, so only the others are shipped (with all custom, price
+    and open entries). `options` are the arguments of BeancountEnvelope.
+    """
+    module = BeancountEnvelope(context, postfix, **options)
+    is_budget_account = module.classifier.is_budget_account
+    transactions = [e for e in context.transactions_between(datetime.date.min, module.date_end)
+                    if any(is_budget_account(p.account) for p in e.postings)]
+
+    by_type = context.entries_by_type
+    entries = sorted(transactions + list(by_type.Custom) + list(by_type.Price) + list(by_type.Open),
+                     key=data.entry_sortkey)
+    return BudgetInput(postfix, entries, context.options_map, dict(options, today=module.today))
+
+
+def wrapper_from_input(budget: BudgetInput):
+    context = LedgerContext(budget.entries, [], budget.options_map)
+    return EnvelopeWrapper(BeancountEnvelope(context, budget.postfix, **budget.options))
+
+
+def build_wrappers_in_processes(executor, context, budgets):
+    """The EnvelopeWrapper of each budget (as (postfix, options)), each computed by a worker of the executor."""
+    inputs = [budget_input(context, postfix, **options) for postfix, options in budgets]
+    return list(executor.map(wrapper_from_input, inputs))
+
+
 class EnvelopeWrapper:
 
-    def __init__(self, entries, errors, options, module: BeancountEnvelope):
+    def __init__(self, module: BeancountEnvelope, actual_expenses=None):
         self.initialized = module is not None
+        self.numeric = module.numeric if self.initialized else DECIMAL
 
         if not self.initialized:
             return
 
-        parser = TransactionParser(entries, errors, options,
-                                   currency=module.currency,
-                                   budget_accounts=module.budget_accounts,
-                                   mappings=module.mappings)
-
-        self.income_tables, envelope_tables, all_activity, self.current_month = module.envelope_tables(parser)
+        parser = _transaction_parser(module)
+        with span('envelope tables'):
+            self.income_tables, envelope_tables, all_activity, self.current_month = \
+                module.envelope_tables(parser, actual_expenses)
+        # the tables may need more digits than the currency, see MinorUnitsBackend.for_values
+        self.numeric = module.numeric
 
         # IMPORTANT: if this is empty, it defaults to type float64, which cannot be added.
         from_accounts = all_activity.groupby(axis=0, level=0).sum(numeric_only=False)
@@ -367,20 +497,58 @@ def __init__(self, entries, errors, options, module: BeancountEnvelope):
         available = envelope_tables.xs(key='available', level=1, axis=1)
 
         all_data = pd.concat({'activity': from_accounts, 'budgeted': budgeted, 'available': available}, axis=1)
-        self.bucket_data = all_data.swaplevel(1, 0, axis=1).fillna(Decimal('0.00'))
-
-        bg = EnvelopesWithGoals(entries, errors, options, module.currency)
-        detail_goals, spending = bg.get_spending_goals(module.date_start, module.date_end, module.mappings,
-                                                       all_activity.index, self.bucket_data, self.current_month,
-                                                       module.target_entries)
-
-        targets, rem_months, targets_monthly = bg.parse_budget_goals(module.date_start, module.date_end,
-                                                                     module.target_entries)
-        targets, monthly_target = get_targets(targets, rem_months, targets_monthly, self.bucket_data)
-        self.all_targets = merge_all_targets({'sg': spending, 't': targets, 'tm': monthly_target})
-
-        self.account_data = pd.concat({'activity': all_activity, 'goals': detail_goals}, axis=1).swaplevel(1, 0, axis=1)
-        self.account_to_buckets = get_level_as_dict(self.account_data, [self.bucket_data, self.all_targets])
+        self.bucket_data = self.numeric.fill(all_data.swaplevel(1, 0, axis=1), Decimal('0.00'))
+
+        # goals are evaluated on amounts, whatever the tables are stored in
+        bucket_amounts = self.numeric.decimals(self.bucket_data)
+
+        bg = EnvelopesWithGoals(module.context, module.currency)
+        with span('spending goals'):
+            detail_goals, spending = bg.get_spending_goals(module.date_start, module.date_end, module.classifier,
+                                                           all_activity.index, bucket_amounts, self.current_month,
+                                                           module.settings("spending"))
+
+        with span('targets'):
+            targets, rem_months, targets_monthly = bg.parse_budget_goals(module.date_start, module.date_end,
+                                                                         module.settings("target"))
+            targets, monthly_target = get_targets(targets, rem_months, targets_monthly, bucket_amounts)
+            self.all_targets = merge_all_targets({'sg': spending, 't': targets, 'tm': monthly_target})
+
+        with span('tables'):
+            self.account_data = pd.concat({'activity': all_activity, 'goals': detail_goals},
+                                          axis=1).swaplevel(1, 0, axis=1)
+            self.account_to_buckets = get_level_as_dict(self.account_data, [self.bucket_data, self.all_targets])
+
+        self._hierarchy = dict()
+        self._period_data = functools.lru_cache(maxsize=PERIOD_CACHE_SIZE)(self._build_period_data)
+
+    # the tables the results of a budget consist of, everything else is derived from them on demand
+    TABLES = ('income_tables', 'bucket_data', 'account_data', 'all_targets')
+
+    @cached_property
+    def _bucket_columns(self):
+        return PeriodColumns(self.bucket_data)
+
+    @cached_property
+    def _target_columns(self):
+        return PeriodColumns(self.all_targets)
+
+    @cached_property
+    def _account_columns(self):
+        return PeriodColumns(self.account_data)
+
+    def __getstate__(self):
+        # the period cache and the columns are rebuilt on demand, e.g. after computing the wrapper in a worker
+        state = dict(self.__dict__)
+        for name in ('_period_data', '_bucket_columns', '_target_columns', '_account_columns'):
+            state.pop(name, None)
+        state['_hierarchy'] = dict()
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.initialized:
+            self._period_data = functools.lru_cache(maxsize=PERIOD_CACHE_SIZE)(self._build_period_data)
 
     def get_budgets_months_available(self):
         return [] if not self.initialized else self.income_tables.columns
@@ -389,36 +557,38 @@ def get_summary(self, period: str):
         if not self.initialized:
             return PeriodSummary(period, None)
 
-        return PeriodSummary(period, self.income_tables[period])
+        return PeriodSummary(period, self.income_tables[period], self.numeric)
 
     def get_inventories(self, period: str, include_real_accounts):
-
-        include_real_accounts = include_real_accounts if not None else False
-
         today = datetime.date.today()
         if period is None:
             year = today.year
             month = today.month
             period = f'{year:04}-{month:02}'
 
-        rows = ddict(AccountRow)
+        if not self.initialized or period not in self._bucket_columns.columns:
+            return PeriodData(period, dict(), [], period == today.strftime('%Y-%m'))
 
-        if not self.initialized or period not in self.bucket_data:
-            return PeriodData(period, rows, [], period == today.strftime('%Y-%m'))
+        return self._period_data(period, bool(include_real_accounts))
 
-        buckets_by_month = self.bucket_data.xs(key=period, level=0, axis=1, drop_level=True)
-        target_by_month = self.all_targets.xs(key=period, level=0, axis=1, drop_level=True)
-        accounts_in_month = self.account_data.xs(key=period, level=0, axis=1, drop_level=True).fillna(0)
+    def _build_period_data(self, period, include_real_accounts):
+        rows = ddict(lambda: AccountRow(self.numeric))
 
-        for index, e_row in buckets_by_month.iterrows():
-            rows[index].set_bucket_row(index, e_row)
+        for index, values in self._bucket_columns.rows(period):
+            rows[index].set_bucket_row(index, BucketValues(values['activity'], values['budgeted'],
+                                                           values['available']))
 
-        for index, e_row in target_by_month.iterrows():
-            rows[index].set_targets(index, e_row)
+        for index, values in self._target_columns.rows(period):
+            targets = {goal: TargetValues(values.get((goal, 'amount')), values.get((goal, 'ref_amount')))
+                       for goal in ('t', 'tm', 'sg')}
+            rows[index].set_targets(index, targets)
 
-        for index, data in accounts_in_month.iterrows():
-            rows[index[1]].set_account_row(index[1], data)
+        for index, values in self._account_columns.rows(period):
+            values = {field: 0 if pd.isna(value) else value for field, value in values.items()}
+            rows[index[1]].set_account_row(index[1], values)
 
-        acc_hierarchy = get_hierarchy(self.account_to_buckets, include_real_accounts)
-        return PeriodData(period, rows, acc_hierarchy, period == self.current_month)
+        if include_real_accounts not in self._hierarchy:
+            with span('hierarchy'):
+                self._hierarchy[include_real_accounts] = get_hierarchy(self.account_to_buckets, include_real_accounts)
 
+        return PeriodData(period, rows, self._hierarchy[include_real_accounts], period == self.current_month)
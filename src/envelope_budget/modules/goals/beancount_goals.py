@@ -1,16 +1,16 @@
+import bisect
 import datetime
+import logging
 from collections import defaultdict
 from typing import List
 
+import numpy as np
 import pandas as pd
-from beancount.core import prices
-from beancount.core.data import Custom
 from beancount.core.number import Decimal
-from beancount.parser import options
-from dateutil.relativedelta import relativedelta
-from fava.core.budgets import parse_budgets, calculate_budget, Budget, BudgetDict, Interval as FavaInterval
+from fava.core.budgets import parse_budgets, Budget, BudgetDict, Interval as FavaInterval
 
 from envelope_budget.modules.goals import BaseTarget, Interval as OwnInterval
+from envelope_budget.modules.goals.spending import evaluate_budgets
 from envelope_budget.modules.goals.target_types.goal import NeededForSpendingTargetParser, EnvelopeGoalTargetParser
 from envelope_budget.modules.hierarchy.beancount_hierarchy import add_bucket_levels
 
@@ -102,21 +102,41 @@ def get_targets(targets, rem_months, targets_monthly, envelopes):
     return t.applymap(Decimal), tm.applymap(Decimal)
 
 
-class EnvelopesWithGoals:
-    def __init__(self, entries, errors, options_map, currency):
+class _GoalTable:
+    """An account x month table of goal values, filled row by row before it becomes a frame."""
+
+    def __init__(self, dates):
+        self.dates = dates
+        self.rows = dict()
+
+    def set(self, account, first, last, values):
+        row = self.rows.get(account)
+        if row is None:
+            row = self.rows[account] = np.full(len(self.dates), np.nan, dtype=object)
+        row[first:last] = list(values) if isinstance(values, range) else values
+
+    def to_frame(self):
+        if not self.rows:
+            return pd.DataFrame(columns=self.dates)
+        return pd.DataFrame(np.vstack(list(self.rows.values())), index=list(self.rows.keys()), columns=self.dates)
 
-        self.entries = entries
-        self.errors = errors
-        self.options_map = options_map
-        self.price_map = prices.build_price_map(entries)
-        self.acctypes = options.get_account_types(options_map)
+
+class EnvelopesWithGoals:
+    def __init__(self, context, currency):
+
+        self.context = context
+        self.entries = context.entries
+        self.errors = context.errors
+        self.options_map = context.options_map
+        self.price_map = context.price_map
+        self.acctypes = context.acctypes
         self.currency = currency
 
         decimal_precison = '0.00'
         self.Q = Decimal(decimal_precison)
 
     def get_spending_goals(self, date_start, date_end, mappings, multi_level_index, envelopes, current_month, entries=None):
-        entries = self.entries if entries is None else entries
+        entries = self.context.custom if entries is None else entries
         goals_for_accounts = self.parse_spending_targets(date_start, date_end, entries)
         full_hierarchy = add_bucket_levels(goals_for_accounts, multi_level_index, mappings)
 
@@ -136,27 +156,18 @@ def get_spending_goals(self, date_start, date_end, mappings, multi_level_index,
 
 
     def budget_to_dataframe(self, start_date, end_date, budgets):
-        all_months_data = dict()
-        dr = _get_date_range(start_date, end_date)
-        for d in dr:
-            start = d.date()
-            end = start + relativedelta(months=1)
-            values = dict()
-            for be in budgets:
-                # note: calculate_budget_children would also include the sub-categories, which is not what we want here
-                cb = calculate_budget(budgets, be, start, end)
-                if self.currency in cb:
-                    values[be] = cb[self.currency].quantize(self.Q)
-                else:
-                    # TODO EG: show a warning at least?
-                    print(f"WARNING: could not calculate budget for: {be} ({start} - {end})")
-            all_months_data[_date_to_string(d)] = values
+        # note: only the budget of the account itself, not of its sub-categories
+        all_months_data, missing = evaluate_budgets(budgets, _get_date_range(start_date, end_date).values,
+                                                    self.currency, self.Q)
+        if missing:
+            logging.warning(f"could not calculate budget in {self.currency} for: " +
+                            ', '.join(f'{a} ({m[0]} - {m[-1]})' if len(m) > 1 else f'{a} ({m[0]})'
+                                      for a, m in sorted(missing.items())))
 
         return pd.DataFrame(all_months_data).sort_index()
 
     def parse_fava_budget(self, start_date, end_date):
-        custom = [e for e in self.entries if isinstance(e, Custom)]
-        budgets, errors = parse_budgets(custom)
+        budgets, errors = parse_budgets(self.context.custom_of_type('budget'))
         return self.budget_to_dataframe(start_date, end_date, budgets)
 
     def parse_spending_targets(self, start_date, end_date, target_entries):
@@ -167,30 +178,35 @@ def parse_spending_targets(self, start_date, end_date, target_entries):
 
     def parse_budget_goals(self, start_date, end_date, target_entries):
         dates = _get_date_range(start_date, end_date)
+        months = [_date_to_string(d) for d in dates]
         parser = EnvelopeGoalTargetParser()
         targets = parser.parse_entries(target_entries)
 
-        target_amounts = pd.DataFrame(columns=dates)
-        monthly_targets = pd.DataFrame(columns=dates)
-        months_remaining = pd.DataFrame(columns=dates)
+        target_amounts = _GoalTable(dates)
+        monthly_targets = _GoalTable(dates)
+        months_remaining = _GoalTable(dates)
 
         for item in targets:
             a = item.account
+            if not item.target and not item.monthly_target:
+                continue
+
+            # the months from the start to the target date, both inclusive
+            first = bisect.bisect_left(months, _date_to_string(item.start_date))
+            last = len(months) if item.target_date is None \
+                else bisect.bisect_right(months, _date_to_string(item.target_date))
+
             if item.target:
-                amount = item.target.number
-                start = _date_to_string(item.start_date)
-                end = _date_to_string(item.target_date) if item.target_date is not None else None
-                target_amounts.loc[a, start:end] = amount
-
-                if end is not None:
-                    mr = {r: _month_diff(r, item.target_date) for r in dates if
-                          item.start_date <= r.date() <= item.target_date}
-                    if mr:
-                        months_remaining.loc[a, mr.keys()] = mr
-            elif item.monthly_target:
-                amount = item.monthly_target.number
-                start = _date_to_string(item.start_date)
-                end = _date_to_string(item.target_date) if item.target_date is not None else None
-                monthly_targets.loc[a, start:end] = amount
-
-        return target_amounts.dropna(axis=0, how='all'), months_remaining, monthly_targets
+                target_amounts.set(a, first, last, item.target.number)
+
+                if item.target_date is not None:
+                    # a target starting within a month only counts down from the next month
+                    first_remaining = bisect.bisect_left(dates, pd.Timestamp(item.start_date))
+                    if first_remaining < last:
+                        remaining = _month_diff(dates[first_remaining].date(), item.target_date)
+                        months_remaining.set(a, first_remaining, last,
+                                             range(remaining, remaining - last + first_remaining, -1))
+            else:
+                monthly_targets.set(a, first, last, item.monthly_target.number)
+
+        return target_amounts.to_frame().dropna(axis=0, how='all'), months_remaining.to_frame(), monthly_targets.to_frame()
@@ -0,0 +1,70 @@
+import numpy as np
+from beancount.core.number import Decimal
+from fava.core.budgets import BudgetDict, Interval as FavaInterval
+
+
+def _period_days(interval: FavaInterval, month_start, month_end):
+    """The number of days of the interval around each month, as fava divides a budget over it."""
+    if interval is FavaInterval.DAY:
+        return np.ones(len(month_start), dtype=np.int64)
+    if interval is FavaInterval.WEEK:
+        return np.full(len(month_start), 7, dtype=np.int64)
+    if interval is FavaInterval.MONTH:
+        return (month_end - month_start).astype(np.int64)
+
+    months = month_start.astype('datetime64[M]')
+    if interval is FavaInterval.QUARTER:
+        start = months - months.astype(np.int64) % 3
+        return ((start + 3).astype('datetime64[D]') - start.astype('datetime64[D]')).astype(np.int64)
+    if interval is FavaInterval.YEAR:
+        start = months.astype('datetime64[Y]')
+        return ((start + 1).astype('datetime64[D]') - start.astype('datetime64[D]')).astype(np.int64)
+    raise NotImplementedError(interval)
+
+
+def evaluate_budgets(budgets: BudgetDict, month_starts, currency, quantum):
+    """The budget of every account in each month, as fava's calculate_budget computes it day by day.
+
+    A budget is active from its start date until the next budget of the same
+    account and currency starts; it contributes `number / days of its interval`
+    for every active day. Per account the active days of each budget in each
+    month are counted at once on the month boundaries.
+
+    Returns the amounts {month: {account: amount}} and the months in which an
+    account has no budget in `currency` as {account: [month, ...]}.
+    """
+    month_start = np.asarray(month_starts, dtype='datetime64[D]')
+    month_end = (month_start.astype('datetime64[M]') + 1).astype('datetime64[D]')
+    names = [str(m) for m in month_start.astype('datetime64[M]')]
+
+    values = {name: dict() for name in names}
+    missing = dict()
+    period_days = dict()
+
+    for account, budget_list in budgets.items():
+        in_currency = sorted((b for b in budget_list if b.currency == currency), key=lambda b: b.date_start)
+
+        active = np.zeros(len(names), dtype=bool)
+        totals = [Decimal(0)] * len(names)
+        for index, budget in enumerate(in_currency):
+            start = np.datetime64(budget.date_start, 'D')
+            end = np.datetime64(in_currency[index + 1].date_start, 'D') if index + 1 < len(in_currency) \
+                else np.datetime64('9999-12-31', 'D')
+            days = np.clip((np.minimum(month_end, end) - np.maximum(month_start, start)).astype(np.int64), 0, None)
+            if not days.any():
+                continue
+
+            if budget.period not in period_days:
+                period_days[budget.period] = _period_days(budget.period, month_start, month_end)
+            per_day = period_days[budget.period]
+
+            active |= days > 0
+            for m in np.flatnonzero(days):
+                totals[m] += budget.number / int(per_day[m]) * int(days[m])
+
+        for m in np.flatnonzero(active):
+            values[names[m]][account] = totals[m].quantize(quantum)
+        if not active.all():
+            missing[account] = [names[m] for m in np.flatnonzero(~active)]
+
+    return values, missing
@@ -0,0 +1,138 @@
+import collections
+import re
+
+from beancount.core import account_types
+
+AccountClass = collections.namedtuple('AccountClass', 'bucket is_mapped is_budget_account is_income account_type')
+
+_REGEX_META = set('.^$*+?{}[]\\|()')
+
+
+def literal_prefix(regexp):
+    """Return the prefix a compiled pattern is equivalent to, or None.
+
+    `re.match` anchors at the start of the account name, so a pattern without
+    any regex syntax, optionally followed by `.*` or by a single starred
+    character (as in "Liabilities:Credit-Cards:*"), is a plain prefix test.
+    """
+    if regexp.flags & ~re.UNICODE:
+        return None
+
+    pattern = regexp.pattern
+    if pattern.endswith('.*'):
+        pattern = pattern[:-2]
+    elif len(pattern) >= 2 and pattern[-1] == '*' and pattern[-2] not in _REGEX_META:
+        pattern = pattern[:-2]
+
+    if any(c in _REGEX_META for c in pattern):
+        return None
+    return pattern
+
+
+class PatternSet:
+    """An ordered list of patterns, answering which one matches an account first.
+
+    Plain prefixes are looked up in a character trie, only the remaining real
+    regular expressions are evaluated one by one.
+    """
+
+    _RULE = None
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        self._trie = dict()
+        self._regexes = []
+
+        for index, regexp in enumerate(self.patterns):
+            prefix = literal_prefix(regexp)
+            if prefix is None:
+                self._regexes.append((index, regexp))
+                continue
+
+            node = self._trie
+            for c in prefix:
+                node = node.setdefault(c, dict())
+            node.setdefault(self._RULE, index)
+
+    def first_match(self, account):
+        """Index of the first pattern matching the account, or None."""
+        best = None
+        node = self._trie
+        for c in account:
+            if self._RULE in node:
+                best = node[self._RULE] if best is None else min(best, node[self._RULE])
+            node = node.get(c)
+            if node is None:
+                break
+        else:
+            if self._RULE in node:
+                best = node[self._RULE] if best is None else min(best, node[self._RULE])
+
+        for index, regexp in self._regexes:
+            if best is not None and index > best:
+                break
+            if regexp.match(account):
+                return index
+
+        return best
+
+    def matches(self, account):
+        return self.first_match(account) is not None
+
+
+class AccountClassifier:
+    """Resolves each distinct account name once to its `AccountClass`.
+
+    Replaces the repeated scans over the regex lists of the budget settings
+    (budget accounts, mappings and income accounts) for every posting.
+    """
+
+    def __init__(self, budget_accounts=(), mappings=(), income_accounts=(), acctypes=None):
+        self.budget_accounts = list(budget_accounts)
+        self.mappings = list(mappings)
+        self.income_accounts = list(income_accounts)
+        self.income_type = acctypes.income if acctypes is not None else 'Income'
+        self.acctypes = acctypes
+
+        self._budget = PatternSet(self.budget_accounts)
+        self._buckets = PatternSet(regexp for regexp, _ in self.mappings)
+        self._income = PatternSet(self.income_accounts)
+        self._classes = dict()
+
+    @classmethod
+    def of(cls, mappings):
+        """Use an existing classifier, or build one for a plain list of mappings."""
+        return mappings if isinstance(mappings, AccountClassifier) else cls(mappings=mappings)
+
+    def for_income_accounts(self, income_accounts):
+        """A classifier with the same settings, but the given income accounts."""
+        if [r.pattern for r in income_accounts] == [r.pattern for r in self.income_accounts]:
+            return self
+        return AccountClassifier(self.budget_accounts, self.mappings, income_accounts, self.acctypes)
+
+    def classify(self, account) -> AccountClass:
+        result = self._classes.get(account)
+        if result is None:
+            account_type = account_types.get_account_type(account)
+            mapping = self._buckets.first_match(account)
+            result = AccountClass(
+                bucket=self.mappings[mapping][1] if mapping is not None else account,
+                is_mapped=mapping is not None,
+                is_budget_account=self._budget.matches(account),
+                is_income=account_type == self.income_type or self._income.matches(account),
+                account_type=account_type)
+            self._classes[account] = result
+        return result
+
+    def bucket(self, account):
+        return self.classify(account).bucket
+
+    def bucket_or_none(self, account):
+        account_class = self.classify(account)
+        return account_class.bucket if account_class.is_mapped else None
+
+    def is_budget_account(self, account):
+        return self.classify(account).is_budget_account
+
+    def is_income(self, account):
+        return self.classify(account).is_income
@@ -1,13 +1,15 @@
 
 import collections
+import numpy as np
 import pandas as pd
 import datetime
 
 from beancount.core.number import Decimal
-from beancount.core import amount, convert, prices, inventory, data, account_types
-from beancount.parser import options
+from beancount.core import amount, convert, inventory, data
 
-from envelope_budget.modules.hierarchy.beancount_hierarchy import map_to_bucket
+from envelope_budget.modules.hierarchy.account_classifier import AccountClassifier
+from envelope_budget.modules.hierarchy.contributions import ContributionJob, ContributionStore, update_all
+from envelope_budget.modules.timing import span
 
 
 def _get_date_range(start, end):
@@ -20,54 +22,64 @@ def _date_to_string(x):
 
 class TransactionParser:
 
-    def __init__(self, entries, errors, options_map, currency, budget_accounts, mappings):
-        self.entries = entries
-        self.errors = errors
-        self.options_map = options_map
-        self.price_map = prices.build_price_map(entries)
-        self.acctypes = options.get_account_types(options_map)
+    def __init__(self, context, currency, budget_accounts, mappings, classifier=None, contributions=None):
+        self.context = context
+        self.entries = context.entries
+        self.errors = context.errors
+        self.options_map = context.options_map
+        self.price_map = context.price_map
+        self.acctypes = context.acctypes
         self.currency = currency
         self.budget_accounts = budget_accounts
         self.mappings = mappings
+        self.classifier = classifier if classifier is not None else \
+            AccountClassifier(budget_accounts, mappings, acctypes=self.acctypes)
+        self.contributions = contributions
 
         decimal_precison = '0.00'
         self.Q = Decimal(decimal_precison)
 
     def is_income(self, account, income_accounts):
-        account_type = account_types.get_account_type(account)
-        return account_type == self.acctypes.income or any(regexp.match(account) for regexp in income_accounts)
+        return self.classifier.for_income_accounts(income_accounts).is_income(account)
 
     def is_budget_account(self, account):
-        if any(regexp.match(account) for regexp in self.budget_accounts):
-            return True
-        return False
+        return self.classifier.is_budget_account(account)
 
     def _get_bucket(self, account):
-        for regexp, target_account in self.mappings:
-            if regexp.match(account):
-                return target_account
-
-        return account
+        return self.classifier.bucket(account)
 
     def parse_transactions(self, start, end, income_accounts):
 
-        balances = self._parse_actual_postings(start, end, income_accounts)
-        sbalances = self._sort_and_reduce(balances)
+        with span('contributions'):
+            if self.contributions is None:
+                balances = self._parse_actual_postings(start, end, income_accounts)
+                sbalances = self._sort_and_reduce(balances)
+            else:
+                sbalances = self._update_contributions(start, end, income_accounts)
+
+        with span('frame'):
+            return self._to_frame(sbalances, start, end)
+
+    def _to_frame(self, sbalances, start, end):
         date_range = _get_date_range(start, end)
 
         row_index = pd.MultiIndex.from_tuples(sbalances.keys(), names=['bucket', 'account'])
         col_index = [_date_to_string(m) for m in date_range]
-        actual_expenses = pd.DataFrame(index=row_index, columns=col_index)
+        columns = {(m.year, m.month): i for i, m in enumerate(date_range)}
 
-        for month in date_range:
-            column = _date_to_string(month)
-            for account in sorted(sbalances.keys()):
-                total = sbalances[account].get((month.year, month.month), None)
-                temp = total.quantize(self.Q) if total else 0.00
-                temp *= -1
-                actual_expenses.loc[account][column] = Decimal(temp)
+        # months without activity are (negated) zero
+        values = np.full((len(row_index), len(col_index)), Decimal(-0.00), dtype=object)
+        for row, months in enumerate(sbalances.values()):
+            for month, total in months.items():
+                column = columns.get(month)
+                if column is not None and total:
+                    # swap sign to be more human readable
+                    values[row, column] = total.quantize(self.Q) * -1
 
-        return actual_expenses
+        return pd.DataFrame(values, index=row_index, columns=col_index)
+
+    def _transactions(self, start_date, end_date):
+        return self.context.transactions_between(start_date, end_date)
 
     def _parse_actual_postings(self, start_date, end_date, income_accounts):
 
@@ -75,64 +87,113 @@ def _parse_actual_postings(self, start_date, end_date, income_accounts):
         balances = collections.defaultdict(
             lambda: collections.defaultdict(inventory.Inventory))
 
-        # Check entry in date range
-        for entry in data.filter_txns([e for e in self.entries if start_date <= e.date <= end_date]):
+        self.classifier = self.classifier.for_income_accounts(income_accounts)
 
+        # Check entry in date range
+        for entry in self._transactions(start_date, end_date):
             month = (entry.date.year, entry.date.month)
+            for row, posting in self._contributions(entry):
+                balances[row][month].add_position(posting)
 
-            if not any(self.is_budget_account(p.account) for p in entry.postings):
-                continue
-
-            if any(self.is_income(p.account, income_accounts) for p in entry.postings):
-                for posting in entry.postings:
-                    if posting.units.currency != self.currency:
-                        orig=posting.units.number
-                        if posting.price is not None:
-                            converted=posting.price.number*orig
-                            posting=data.Posting(posting.account,amount.Amount(converted,self.currency), posting.cost, None, posting.flag,posting.meta)
-                        else:
-                            continue
-                    if self.is_budget_account(posting.account):
-                        continue
+        return balances
 
-                    account_type = account_types.get_account_type(posting.account)
-                    if account_type == self.acctypes.income or any(regexp.match(posting.account) for regexp in income_accounts):
-                        bucket = "Income"
-                    #elif account_type == self.acctypes.expenses:
-                    #    bucket = "Income:Deduction"
+    def _update_contributions(self, start_date, end_date, income_accounts):
+        job = self._contribution_job(self.contributions, start_date, end_date, income_accounts)
+        return update_all([job], self._transactions(start_date, end_date))[0]
+
+    def _contribution_job(self, store, start_date, end_date, income_accounts):
+        self.classifier = self.classifier.for_income_accounts(income_accounts)
+
+        # anything the contributions of the transactions or their conversion depends on
+        settings = (self.currency, self.acctypes,
+                    tuple(r.pattern for r in self.classifier.budget_accounts),
+                    tuple((r.pattern, bucket) for r, bucket in self.classifier.mappings),
+                    tuple(r.pattern for r in self.classifier.income_accounts),
+                    tuple((p.date, p.currency, p.amount) for p in self.context.entries_by_type.Price))
+
+        return ContributionJob(store, settings, start_date, end_date, self._contributions, self._reduce)
+
+    def _contributions(self, entry):
+        """The (bucket, account) rows the postings of a budget transaction are added to."""
+        classes = [self.classifier.classify(p.account) for p in entry.postings]
+        contributions = []
+
+        if not any(c.is_budget_account for c in classes):
+            return contributions
+
+        if any(c.is_income for c in classes):
+            for posting, account_class in zip(entry.postings, classes):
+                if posting.units.currency != self.currency:
+                    orig=posting.units.number
+                    if posting.price is not None:
+                        converted=posting.price.number*orig
+                        posting=data.Posting(posting.account,amount.Amount(converted,self.currency), posting.cost, None, posting.flag,posting.meta)
                     else:
-                        bucket = map_to_bucket(self.mappings, posting.account)
-
-                    balances[(bucket, posting.account)][month].add_position(posting)
-            else:
-                for posting in entry.postings:
-                    if posting.units.currency != self.currency:
-                        continue
-                    if self.is_budget_account(posting.account):
                         continue
-                    # TODO Warn of any assets / liabilities left
-
-                    bucket = map_to_bucket(self.mappings, posting.account)
-                    # TODO
-                    balances[(bucket, posting.account)][month].add_position(posting)
-
-        return balances
+                if account_class.is_budget_account:
+                    continue
+
+                if account_class.is_income:
+                    bucket = "Income"
+                #elif account_type == self.acctypes.expenses:
+                #    bucket = "Income:Deduction"
+                else:
+                    bucket = account_class.bucket
+
+                contributions.append(((bucket, posting.account), posting))
+        else:
+            for posting, account_class in zip(entry.postings, classes):
+                if posting.units.currency != self.currency:
+                    continue
+                if account_class.is_budget_account:
+                    continue
+                # TODO Warn of any assets / liabilities left
+
+                bucket = account_class.bucket
+                # TODO
+                contributions.append(((bucket, posting.account), posting))
+
+        return contributions
 
     def _sort_and_reduce(self, balances):
 
         sbalances = collections.defaultdict(dict)
         for account, months in sorted(balances.items()):
             for month, balance in sorted(months.items()):
-                year, mth = month
-                date = datetime.date(year, mth, 1)
-                balance = balance.reduce(convert.get_value, self.price_map, date)
-                balance = balance.reduce(
-                    convert.convert_position, self.currency, self.price_map, date)
-                try:
-                    pos = balance.get_only_position()
-                except AssertionError:
-                    print(balance)
-                    raise
-                total = pos.units.number if pos and pos.units else None
-                sbalances[account][month] = total
+                sbalances[account][month] = self._reduce(month, balance)
         return sbalances
+
+    def _reduce(self, month, balance):
+        year, mth = month
+        date = datetime.date(year, mth, 1)
+        balance = balance.reduce(convert.get_value, self.price_map, date)
+        balance = balance.reduce(
+            convert.convert_position, self.currency, self.price_map, date)
+        try:
+            pos = balance.get_only_position()
+        except AssertionError:
+            print(balance)
+            raise
+        return pos.units.number if pos and pos.units else None
+
+
+def parse_all_transactions(requests):
+    """The activity of several budgets of one ledger, from a single pass over its transactions.
+
+    `requests` are (parser, start, end, income_accounts) as for `TransactionParser.parse_transactions`,
+    the frames are returned in the same order.
+    """
+    if not requests:
+        return []
+
+    context = requests[0][0].context
+    jobs = [parser._contribution_job(parser.contributions if parser.contributions is not None else ContributionStore(),
+                                     start, end, income_accounts)
+            for parser, start, end, income_accounts in requests]
+    transactions = context.transactions_between(min(job.start for job in jobs), max(job.end for job in jobs))
+
+    with span('contributions'):
+        results = update_all(jobs, transactions)
+    with span('frame'):
+        return [parser._to_frame(sbalances, start, end)
+                for (parser, start, end, _), sbalances in zip(requests, results)]
@@ -5,6 +5,8 @@
 from beancount.core import inventory, account
 from beancount.core.number import Decimal
 
+from envelope_budget.modules.hierarchy.account_classifier import AccountClassifier
+
 
 class Bucket(dict):
 
@@ -125,14 +127,6 @@ def get_or_create(bucket, real_account_name):
     return real_child
 
 
-def map_to_bucket(mappings, name: str):
-    for regexp, target_bucket in mappings:
-        if regexp.match(name):
-            return target_bucket
-
-    return name
-
-
 def map_accounts_to_bucket(mappings, accounts):
     accounts_to_match = list(accounts)
     buckets = dict()
@@ -195,14 +189,15 @@ def add_bucket_levels(single_level_df, hierarchy_index, mappings, lvl_name='acco
 
     # 1. check which accounts are already mapped:
     known_accounts = set(hierarchy_index.get_level_values(level=lvl_name))
-    accounts_to_match = set(single_level_df.index.values)
+    unmatched_accounts = [name for name in single_level_df.index.values if name not in known_accounts]
 
     df = df.join(single_level_df)
-    unmatched_accounts = accounts_to_match.difference(known_accounts)
 
-    for name in unmatched_accounts:
-        bucket = map_to_bucket(mappings, name)
-        row = single_level_df.loc[name]
-        df.loc[(bucket, name), :] = row
+    # 2. add the others below their bucket, all at once
+    if unmatched_accounts:
+        classifier = AccountClassifier.of(mappings)
+        index = pd.MultiIndex.from_tuples([(classifier.bucket(name), name) for name in unmatched_accounts],
+                                          names=df.index.names)
+        df = pd.concat([df, single_level_df.loc[unmatched_accounts].set_axis(index, axis=0)])
 
     return df.fillna(Decimal(0.00))
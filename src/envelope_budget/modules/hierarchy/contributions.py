@@ -0,0 +1,133 @@
+import collections
+import contextlib
+import threading
+
+from beancount.core import inventory
+
+
+def entry_key(entry):
+    """The content of a transaction its contribution depends on (metadata excluded)."""
+    return (entry.date, entry.flag, entry.payee, entry.narration, entry.tags, entry.links,
+            tuple((p.account, p.units, p.cost, p.price, p.flag) for p in entry.postings))
+
+
+def _month(entry):
+    return entry.date.year, entry.date.month
+
+
+# what one budget takes from a pass over the transactions, see update_all
+ContributionJob = collections.namedtuple('ContributionJob', 'store settings start end contribute reduce')
+
+
+class _Update:
+    """The records of one store while the transactions are passed."""
+
+    def __init__(self, previous):
+        self.previous = previous
+        self.current = collections.defaultdict(list)
+        self.dirty = set()
+
+    def add(self, key, entry, contribute):
+        known = self.previous.get(key)
+        if known:
+            record = known.pop()
+        else:
+            record = (_month(entry), contribute(entry))
+            if record[1]:
+                self.dirty.add(record[0])
+        self.current[key].append(record)
+
+
+def update_all(jobs, transactions):
+    """Update the stores of several budgets in one pass over the transactions, see ContributionStore.update.
+
+    Each job only takes the transactions from its `start` to its `end` date
+    (inclusive, None is open). Returns the monthly totals of each job.
+    """
+    stores = {id(job.store): job.store for job in jobs}
+    if len(stores) != len(jobs):
+        raise ValueError("every job needs a store of its own")
+
+    with contextlib.ExitStack() as stack:
+        for _, store in sorted(stores.items()):
+            stack.enter_context(store._lock)
+
+        updates = [job.store._begin(job.settings) for job in jobs]
+        for entry in transactions:
+            key = None
+            for job, update in zip(jobs, updates):
+                if (job.start is None or job.start <= entry.date) and (job.end is None or entry.date <= job.end):
+                    key = entry_key(entry) if key is None else key
+                    update.add(key, entry, job.contribute)
+
+        return [job.store._finish(update, job.reduce) for job, update in zip(jobs, updates)]
+
+
+class ContributionStore:
+    """Per-transaction contributions to the monthly activity of one budget.
+
+    The store outlives a reload of the ledger: transactions are keyed by their
+    content, so after a reload only new or changed transactions are classified
+    again, and only the months touched by changed (or removed) transactions are
+    summed up again. The months that changed are kept in `dirty_months`.
+    """
+
+    def __init__(self):
+        self.settings = None
+        self.dirty_months = set()
+        # the previous rollover result, see BeancountEnvelope
+        self.rollover = None
+        self._entries = dict()
+        self._totals = dict()
+        self._lock = threading.Lock()
+
+    def reset(self, settings):
+        self.settings = settings
+        self.rollover = None
+        self._entries = dict()
+        self._totals = dict()
+
+    def update(self, settings, transactions, contribute, reduce):
+        """Monthly totals per row (as {row: {(year, month): total}}), sorted by row.
+
+        `contribute(entry)` lists the (row, posting) pairs a transaction adds,
+        `reduce(month, balance)` turns the inventory of a row in a month into a number.
+        Changing the settings (anything the contributions depend on) drops everything.
+        """
+        return update_all([ContributionJob(self, settings, None, None, contribute, reduce)], transactions)[0]
+
+    def _begin(self, settings):
+        if settings != self.settings:
+            self.reset(settings)
+        return _Update(self._entries)
+
+    def _finish(self, update, reduce):
+        dirty = update.dirty
+        for records in update.previous.values():
+            dirty.update(month for month, contributions in records if contributions)
+
+        if dirty:
+            self._sum_up(update.current, dirty, reduce)
+
+        self._entries = update.current
+        self.dirty_months = dirty
+
+        sbalances = collections.defaultdict(dict)
+        for month in sorted(self._totals):
+            for row, total in self._totals[month].items():
+                sbalances[row][month] = total
+        return collections.defaultdict(dict, sorted(sbalances.items()))
+
+    def _sum_up(self, entries, months, reduce):
+        balances = {month: collections.defaultdict(inventory.Inventory) for month in months}
+        for records in entries.values():
+            for month, contributions in records:
+                if month in balances:
+                    for row, posting in contributions:
+                        balances[month][row].add_position(posting)
+
+        for month, rows in balances.items():
+            if rows:
+                self._totals[month] = {row: reduce(month, balance) for row, balance in sorted(rows.items())}
+            else:
+                self._totals.pop(month, None)
@@ -0,0 +1,100 @@
+import bisect
+import collections
+from functools import cached_property
+
+from beancount.core import prices
+from beancount.parser import options
+from fava.core.group_entries import group_entries_by_type
+
+from envelope_budget.modules.balance_index import BalanceIndex
+
+
+class LedgerContext:
+    """The loaded ledger together with the indexes the budget engine needs.
+
+    Everything derived from the entries (entries by type, the price map, the
+    account types) is built at most once per load and shared by all stages of
+    the engine and all configured budgets.
+    """
+
+    def __init__(self, entries, errors, options_map, entries_by_type=None, account_meta=None):
+        self.entries = entries
+        self.errors = errors
+        self.options_map = options_map
+        self._entries_by_type = entries_by_type
+        self._account_meta = account_meta
+        self._balance_indexes = dict()
+
+    @classmethod
+    def from_fava(cls, ledger):
+        """Reuse the indexes fava already built when loading the ledger."""
+        account_meta = {name: account.meta for name, account in ledger.accounts.items()}
+        return cls(ledger.all_entries, ledger.errors, ledger.options,
+                   entries_by_type=ledger.all_entries_by_type, account_meta=account_meta)
+
+    @property
+    def entries_by_type(self):
+        if self._entries_by_type is None:
+            self._entries_by_type = group_entries_by_type(self.entries)
+        return self._entries_by_type
+
+    @property
+    def transactions(self):
+        return self.entries_by_type.Transaction
+
+    @cached_property
+    def _transaction_dates(self):
+        return [e.date for e in self.transactions]
+
+    def transactions_between(self, start_date, end_date):
+        """The transactions from `start_date` to `end_date` (inclusive), by bisecting the sorted dates."""
+        dates = self._transaction_dates
+        return self.transactions[bisect.bisect_left(dates, start_date):bisect.bisect_right(dates, end_date)]
+
+    @property
+    def custom(self):
+        return self.entries_by_type.Custom
+
+    @cached_property
+    def _custom_index(self):
+        # one pass over the custom entries, grouped by type and by (type, first value)
+        index = collections.defaultdict(list)
+        for e in self.custom:
+            index[e.type].append(e)
+            index[e.type, e.values[0].value if e.values else None].append(e)
+        # shared by all budgets of the load, so not to be changed by any of them
+        return {key: tuple(entries) for key, entries in index.items()}
+
+    def custom_of_type(self, entry_type, first_value=None):
+        """The custom entries of one type (e.g. the settings of one budget) as a tuple, grouped once per load.
+
+        With `first_value`, only the entries whose first value it is (e.g. the "mapping" entries of a budget).
+        """
+        key = entry_type if first_value is None else (entry_type, first_value)
+        return self._custom_index.get(key, ())
+
+    @property
+    def account_meta(self):
+        if self._account_meta is None:
+            self._account_meta = {e.account: e.meta for e in self.entries_by_type.Open}
+        return self._account_meta
+
+    def balance_index(self, classifier):
+        """The `BalanceIndex` of the budget accounts of a classifier, built once per load."""
+        key = tuple(r.pattern for r in classifier.budget_accounts)
+        index = self._balance_indexes.get(key)
+        if index is None:
+            index = BalanceIndex(self.transactions, classifier.is_budget_account, self.price_map,
+                                 self.options_map['dcontext'].build())
+            self._balance_indexes[key] = index
+        return index
+
+    @cached_property
+    def price_map(self):
+        # fava's FavaPriceMap is not understood by beancount.core.convert, so build
+        # beancount's price map - but only from the price entries.
+        return prices.build_price_map(self.entries_by_type.Price)
+
+    @cached_property
+    def acctypes(self):
+        return options.get_account_types(self.options_map)
@@ -0,0 +1,121 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+from beancount.core.number import Decimal
+
+
+class DecimalBackend:
+    """Amounts are kept as `Decimal` objects in object-dtype frames (the default)."""
+
+    name = 'decimal'
+    zero = Decimal(0)
+
+    def from_decimals(self, df: pd.DataFrame) -> pd.DataFrame:
+        return df.fillna(self.zero)
+
+    def fill(self, df, value=None):
+        return df.fillna(self.zero if value is None else value)
+
+    def scalar(self, value):
+        return Decimal(value)
+
+    def from_decimal(self, value):
+        return value
+
+    def to_decimal(self, value):
+        return value
+
+    def decimals(self, values):
+        return values
+
+    def for_values(self, *tables):
+        return self
+
+
+def _places(tables):
+    """The most fractional digits of the (finite) Decimal values of the tables."""
+    places = 0
+    for table in tables:
+        for value in np.asarray(table, dtype=object).ravel():
+            if isinstance(value, Decimal) and value.is_finite():
+                places = max(places, -value.as_tuple().exponent)
+    return places
+
+
+class MinorUnitsBackend:
+    """Amounts are kept as int64 counts of the smallest currency unit.
+
+    The number of minor units is given by the quantum of the budget currency
+    (e.g. "0.00" for cents), or finer where the amounts of a budget have more
+    digits (see `for_values`), so the tables hold the same amounts as with
+    `Decimal`. Amounts are converted once when the tables are built and turned
+    back into `Decimal` for display and for evaluating the goals, which always
+    work on `Decimal` amounts.
+    """
+
+    name = 'int64'
+    zero = 0
+
+    # more fractional digits than this are kept as Decimal, int64 would overflow too soon
+    MAX_PLACES = 9
+
+    def __init__(self, quantum=Decimal('0.00'), shown=None):
+        self.quantum = quantum
+        self.places = -quantum.as_tuple().exponent
+        # the quantum of the currency, amounts with no more digits are shown with exactly its digits
+        self.shown = quantum if shown is None else shown
+        self._scale = 10 ** (self.places + self.shown.as_tuple().exponent)
+
+    def for_values(self, *tables):
+        """The backend holding the amounts of the tables without rounding any of them."""
+        places = _places(tables)
+        if places <= self.places:
+            return self
+        if places > self.MAX_PLACES:
+            logging.warning(f"amounts with {places} fractional digits, keeping the budget tables as Decimal")
+            return DECIMAL
+        return MinorUnitsBackend(Decimal(1).scaleb(-places), self.shown)
+
+    def from_decimals(self, df: pd.DataFrame) -> pd.DataFrame:
+        values = [self.from_decimal(v) for v in df.to_numpy(dtype=object).ravel()]
+        converted = np.array(values, dtype=np.int64).reshape(df.shape)
+        return pd.DataFrame(converted, index=df.index, columns=df.columns)
+
+    def fill(self, df, value=None):
+        # the fill value is given as an amount, but only ever zero
+        return df.fillna(self.zero).astype(np.int64)
+
+    def scalar(self, value):
+        return int(value)
+
+    def from_decimal(self, value):
+        if value is None or pd.isna(value):
+            return 0
+        return int(Decimal(value).quantize(self.quantum).scaleb(self.places))
+
+    def to_decimal(self, value):
+        if pd.isna(value):
+            return value
+        value = int(value)
+        if self._scale > 1 and value % self._scale == 0:
+            return Decimal(value // self._scale).scaleb(self.shown.as_tuple().exponent)
+        return Decimal(value).scaleb(-self.places)
+
+    def decimals(self, values):
+        if isinstance(values, pd.DataFrame):
+            return values.apply(lambda column: column.map(self.to_decimal))
+        return values.map(self.to_decimal)
+
+
+DECIMAL = DecimalBackend()
+
+
+def get_backend(name, quantum=Decimal('0.00')):
+    if name is None or name == DecimalBackend.name:
+        return DECIMAL
+    if name == MinorUnitsBackend.name:
+        return MinorUnitsBackend(quantum)
+
+    raise ValueError(f"unknown numeric backend: {name}")
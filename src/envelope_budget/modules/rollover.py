@@ -0,0 +1,37 @@
+import numpy as np
+
+from beancount.core.number import Decimal
+
+ZERO = Decimal(0)
+
+
+def rollover_available(budgeted, activity, max_index, previous=None, start=1):
+    """Available amount of every envelope (rows) for every month (columns).
+
+    A month starts with what is budgeted plus the activity; a positive balance of
+    the previous month is carried forward, but only up to the month at
+    `max_index`. Months are scanned in order, each step working on all
+    envelopes at once. Works on `Decimal` (object) and integer arrays alike.
+
+    With `previous`, the months before `start` are taken from there and only the
+    later months are computed again.
+    """
+    net = np.asarray(budgeted) + np.asarray(activity)
+    available = net.copy()
+    if previous is not None:
+        available[:, :start] = previous[:, :start]
+
+    for index in range(max(start, 1), min(max_index + 1, net.shape[1])):
+        prev = available[:, index - 1]
+        carry = (prev > 0).astype(bool)
+        available[carry, index] = prev[carry] + net[carry, index]
+
+    return available
+
+
+def overspent(available):
+    """Sum of the negative available amounts of the previous month, for every month."""
+    zero = ZERO if available.dtype == object else available.dtype.type(0)
+    negative = np.where((available < 0).astype(bool), available, zero)
+    totals = np.add.reduce(negative, axis=0, initial=zero)
+    return np.concatenate([[zero], totals[:-1]]).astype(available.dtype)
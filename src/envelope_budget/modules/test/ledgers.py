@@ -0,0 +1,67 @@
+"""Ledgers shared by several test modules."""
+import textwrap
+
+# two budgets ('main' and 'kids') in one ledger
+TWO_BUDGETS = textwrap.dedent("""
+    option "operating_currency" "EUR"
+
+    2010-01-01 custom "fava-extension" "envelope_budget" "{'start': '2020-01-01', 'future_months': 1, 'future_rollover': True, 'budgets': {'main': ('', 'EUR'), 'kids': ('_kids', 'EUR')}}"
+
+    2011-01-01 open Assets:Checking
+    2011-01-01 open Assets:Kids
+    2011-01-01 open Income:Salary
+    2011-01-01 open Expenses:Food
+    2011-01-01 open Expenses:Toys
+
+    2011-01-01 custom "envelope" "budget account" "Assets:Checking"
+    2011-01-01 custom "envelope_kids" "budget account" "Assets:Kids"
+
+    2020-01-01 custom "envelope" "allocate" "Expenses:Food" 100.00
+    2020-01-01 custom "envelope_kids" "allocate" "Expenses:Toys" 10.00
+
+    2020-01-01 * "Salary"
+      Income:Salary  -1000.00 EUR
+      Assets:Checking
+
+    2020-01-10 * "Food"
+      Expenses:Food  25.00 EUR
+      Assets:Checking
+
+    2020-02-10 * "Toys"
+      Expenses:Toys  5.00 EUR
+      Assets:Kids
+""")
+
+# one budget with a mapping, ordering and names of accounts
+TREE = textwrap.dedent("""
+    option "operating_currency" "EUR"
+
+    2020-01-01 custom "fava-extension" "envelope_budget" "{'start': '2020-01-01', 'future_months': 1, 'future_rollover': True, 'budgets': {'main': ('', 'EUR')}}"
+
+    2011-01-01 open Assets:Checking
+    2011-01-01 open Income:Salary
+    2011-01-01 open Expenses:Food:Groceries
+      ordering: 2
+    2011-01-01 open Expenses:Food:Restaurant
+      ordering: 1
+      name: "Eating out"
+    2011-01-01 open Expenses:Fun
+
+    2011-01-01 custom "envelope" "budget account" "Assets:Checking"
+    2011-01-01 custom "envelope" "mapping" "Expenses:Food:.*" "Expenses:Food"
+
+    2020-01-01 custom "envelope" "allocate" "Expenses:Food" 100.00
+    2020-01-01 custom "envelope" "allocate" "Expenses:Fun" 20.00
+
+    2020-01-01 * "Salary"
+      Income:Salary  -1000.00 EUR
+      Assets:Checking
+
+    2020-01-10 * "Food"
+      Expenses:Food:Groceries  25.00 EUR
+      Assets:Checking
+
+    2020-01-12 * "Food"
+      Expenses:Food:Restaurant  12.50 EUR
+      Assets:Checking
+""")
@@ -0,0 +1,55 @@
+import re
+import unittest
+
+from envelope_budget.modules.hierarchy.account_classifier import AccountClassifier, PatternSet, literal_prefix
+
+
+def _naive_first_match(patterns, account):
+    for index, regexp in enumerate(patterns):
+        if regexp.match(account):
+            return index
+    return None
+
+
+class AccountClassifierTests(unittest.TestCase):
+    def test_literal_prefix(self):
+        self.assertEqual('Assets:Checking', literal_prefix(re.compile('Assets:Checking')))
+        self.assertEqual('Expenses:Food:', literal_prefix(re.compile('Expenses:Food:.*')))
+        self.assertEqual('Liabilities:Credit-Cards', literal_prefix(re.compile('Liabilities:Credit-Cards:*')))
+        self.assertIsNone(literal_prefix(re.compile('Expenses:(Food|Fun)')))
+        self.assertIsNone(literal_prefix(re.compile('Assets:Checking$')))
+        self.assertIsNone(literal_prefix(re.compile('expenses', re.IGNORECASE)))
+
+    def test_first_match_keeps_rule_order(self):
+        patterns = [re.compile(p) for p in ['Expenses:Food:Coffee', 'Expenses:(Food|Fun).*', 'Expenses:Food',
+                                            'Expenses:.*:Books', 'Expenses', '.*Gifts']]
+        pattern_set = PatternSet(patterns)
+
+        accounts = ['Expenses:Food:Coffee', 'Expenses:Food:Groceries', 'Expenses:Fun:Books', 'Expenses:Foo',
+                    'Expenses:Health:Books', 'Income:Gifts', 'Expenses', 'Assets:Cash', '']
+        for account in accounts:
+            self.assertEqual(_naive_first_match(patterns, account), pattern_set.first_match(account), account)
+
+    def test_classify(self):
+        classifier = AccountClassifier(
+            budget_accounts=[re.compile('Assets:Checking'), re.compile('Liabilities:Credit-Cards:*')],
+            mappings=[(re.compile('Expenses:Food:.*'), 'Expenses:Food')],
+            income_accounts=[re.compile('Assets:Refunds')])
+
+        coffee = classifier.classify('Expenses:Food:Coffee')
+        self.assertEqual('Expenses:Food', coffee.bucket)
+        self.assertFalse(coffee.is_budget_account)
+        self.assertFalse(coffee.is_income)
+        self.assertEqual('Expenses', coffee.account_type)
+        self.assertIs(coffee, classifier.classify('Expenses:Food:Coffee'))
+
+        self.assertEqual('Expenses:Rent', classifier.bucket('Expenses:Rent'))
+        self.assertIsNone(classifier.bucket_or_none('Expenses:Rent'))
+        self.assertTrue(classifier.is_budget_account('Liabilities:Credit-Cards:Visa'))
+        self.assertTrue(classifier.is_income('Income:Salary'))
+        self.assertTrue(classifier.is_income('Assets:Refunds'))
+        self.assertFalse(classifier.is_income('Assets:Checking'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import datetime
+import textwrap
+import unittest
+
+from beancount import loader
+from beancount.core.number import D
+from beancount.query import query
+
+from envelope_budget.modules.beancount_envelope import BeancountEnvelope
+from envelope_budget.modules.ledger_context import LedgerContext
+
+LEDGER = textwrap.dedent("""
+    option "operating_currency" "EUR"
+
+    2011-01-01 open Assets:Checking
+    2011-01-01 open Assets:Cash
+    2011-01-01 open Assets:Broker
+    2011-01-01 open Liabilities:Card
+    2011-01-01 open Income:Salary
+    2011-01-01 open Expenses:Food
+    2011-01-01 open Equity:Opening
+
+    2011-01-01 custom "envelope" "budget account" "Assets:Checking"
+    2011-01-01 custom "envelope" "budget account" "Assets:Broker"
+    2011-01-01 custom "envelope" "budget account" "Liabilities:.*"
+    2020-03-01 custom "envelope" "allocate" "Expenses:Food" 100.00
+
+    2019-12-01 * "Opening"
+      Assets:Checking  1000.00 EUR
+      Assets:Cash  50.00 EUR
+      Equity:Opening
+
+    2019-12-15 * "Buy"
+      Assets:Broker  10 USD @ 0.90 EUR
+      Assets:Checking
+
+    2020-01-10 * "Food"
+      Expenses:Food  25.00 EUR
+      Liabilities:Card
+
+    2020-01-20 * "Salary"
+      Income:Salary  -2000.00 EUR
+      Assets:Checking
+
+    2020-03-05 * "Food"
+      Expenses:Food  12.50 EUR
+      Assets:Checking
+
+    2020-02-01 price USD 0.95 EUR
+""")
+
+
+def _query(entries, options_map, date):
+    query_str = f"select account, convert(sum(position),'EUR') from close on {date} group by 1 order by 1;"
+    rows = query.run_query(entries, options_map, query_str, numberify=True)
+    return {row[0]: row[1] for row in rows[1] if row[1] is not None}
+
+
+class BalanceIndexTests(unittest.TestCase):
+    def setUp(self):
+        self.entries, errors, self.options_map = loader.load_string(LEDGER)
+        self.module = BeancountEnvelope(LedgerContext(self.entries, errors, self.options_map), '',
+                                        datetime.date(2020, 1, 1), today=datetime.date(2020, 3, 15))
+
+    def test_same_balances_as_query(self):
+        index = self.module.context.balance_index(self.module.classifier)
+        budget_accounts = ['Assets:Broker', 'Assets:Checking', 'Liabilities:Card']
+
+        for date in ['2019-11-01', '2019-12-01', '2019-12-10', '2020-01-01', '2020-01-15', '2020-02-01',
+                     '2020-03-01', '2020-03-05', '2020-03-06', '2021-01-01']:
+            expected = {k: v for k, v in _query(self.entries, self.options_map, date).items() if k in budget_accounts}
+            self.assertEqual(expected, index.balances(datetime.date.fromisoformat(date), 'EUR'), date)
+
+    def test_index_is_shared(self):
+        context = self.module.context
+        self.assertIs(context.balance_index(self.module.classifier), context.balance_index(self.module.classifier))
+
+    def test_query_account_balances(self):
+        total, positions = self.module.query_account_balances('2020-02-01')
+
+        self.assertEqual(D('2975.50'), total)
+        self.assertEqual(['Assets:Broker', 'Assets:Checking', 'Liabilities:Card'], list(positions.index))
+        self.assertEqual(D('-25.00'), positions.loc['Liabilities:Card', 'EUR'])
+
+
+if __name__ == '__main__':
+    unittest.main()
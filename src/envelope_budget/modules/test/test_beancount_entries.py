@@ -0,0 +1,52 @@
+import datetime
+import textwrap
+import unittest
+
+from beancount import loader
+from beancount.core.number import D
+
+from envelope_budget.modules.beancount_envelope import BeancountEnvelope
+from envelope_budget.modules.hierarchy.beancount_entries import TransactionParser
+from envelope_budget.modules.ledger_context import LedgerContext
+
+
+class ParseTransactionsTests(unittest.TestCase):
+    def test_activity_table(self):
+        entries, errors, options_map = loader.load_string(textwrap.dedent("""
+            option "operating_currency" "EUR"
+
+            2011-01-01 open Assets:Checking
+            2011-01-01 open Income:Salary
+            2011-01-01 open Expenses:Food:Coffee
+            2011-01-01 open Expenses:Fun
+
+            2011-01-01 custom "envelope" "budget account" "Assets:Checking"
+            2011-01-01 custom "envelope" "mapping" "Expenses:Food:.*" "Expenses:Food"
+            2020-02-01 custom "envelope" "allocate" "Expenses:Food" 100.00
+
+            2019-12-24 * "Before the budget"
+              Expenses:Fun  10.00 EUR
+              Assets:Checking
+
+            2020-01-01 * "Salary"
+              Income:Salary  -1000.00 EUR
+              Assets:Checking
+
+            2020-02-10 * "Coffee"
+              Expenses:Food:Coffee  2.504 EUR
+              Assets:Checking
+        """))
+        module = BeancountEnvelope(LedgerContext(entries, errors, options_map), '', datetime.date(2020, 1, 1),
+                                   today=datetime.date(2020, 2, 15))
+        parser = TransactionParser(module.context, module.currency, module.budget_accounts, module.mappings)
+
+        actual = parser.parse_transactions(module.date_start, module.date_end, module.income_accounts)
+
+        self.assertEqual(['2020-01', '2020-02', '2020-03'], list(actual.columns))
+        self.assertEqual([('Expenses:Food', 'Expenses:Food:Coffee'), ('Income', 'Income:Salary')], list(actual.index))
+        self.assertEqual([D('0'), D('-2.50'), D('0')], list(actual.loc[('Expenses:Food', 'Expenses:Food:Coffee')]))
+        self.assertEqual([D('1000.00'), D('0'), D('0')], list(actual.loc[('Income', 'Income:Salary')]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,6 +3,7 @@
 import numpy
 from beancount import loader
 
+import textwrap
 import unittest
 import numpy as np
 import pandas as pd
@@ -11,6 +12,7 @@
 from envelope_budget import BeancountEnvelope
 from envelope_budget.modules.goals.beancount_goals import compute_monthly_targets, EnvelopesWithGoals, get_targets
 from envelope_budget.modules.hierarchy.beancount_entries import TransactionParser
+from envelope_budget.modules.ledger_context import LedgerContext
 
 
 def print_types(df, name):
@@ -27,9 +29,10 @@ class TestGoals(unittest.TestCase):
     def test_get_targets_integration(self):
         entries, errors, options_map = (loader
                                         .load_file('../../../../test/testdata/beancount.2022/root_ledger.beancount'))
-        module = BeancountEnvelope(entries, errors, options_map, budget_postfix="_private",
+        context = LedgerContext(entries, errors, options_map)
+        module = BeancountEnvelope(context, budget_postfix="_private",
                                    today=dt.date(2022,6,10))
-        parser = TransactionParser(entries, errors, options_map,
+        parser = TransactionParser(context,
                                    currency=module.currency,
                                    budget_accounts=module.budget_accounts,
                                    mappings=module.mappings)
@@ -47,7 +50,7 @@ def test_get_targets_integration(self):
         all_data = pd.concat({'activity': from_accounts, 'budgeted': budgeted, 'available': available}, axis=1)
         bucket_data = all_data.swaplevel(1, 0, axis=1).fillna(Decimal('0.00'))
 
-        bg = EnvelopesWithGoals(entries, errors, options_map, module.currency)
+        bg = EnvelopesWithGoals(context, module.currency)
 
         detail_goals, spending = bg.get_spending_goals(module.date_start, module.date_end, module.mappings,
                                                        all_activity.index, bucket_data, current_month)
@@ -70,6 +73,29 @@ def test_get_targets_integration(self):
         monthly_target_months = monthly_target.columns.get_level_values(level=0)
         self.assertListEqual(list(months.values), list(monthly_target_months.values))
 
+    def test_parse_budget_goals(self):
+        entries, errors, options_map = loader.load_string(textwrap.dedent("""
+            2020-01-01 custom "envelope" "target" Expenses:Holiday 500 EUR "by" 2020-04-20
+            2020-01-15 custom "envelope" "target" Expenses:Car 900 EUR "by" 2020-03-01
+            2020-02-10 custom "envelope" "target" Expenses:Savings 100 EUR
+            2020-01-01 custom "envelope" "target" Expenses:Fun "monthly" 30 EUR
+            2020-03-01 custom "envelope" "target" Expenses:Fun "monthly" 40 EUR
+        """))
+        bg = EnvelopesWithGoals(LedgerContext(entries, errors, options_map), 'EUR')
+
+        targets, rem_months, targets_monthly = bg.parse_budget_goals(dt.date(2020, 1, 1), dt.date(2020, 6, 1), entries)
+
+        def row(df, account):
+            return [None if pd.isna(v) else v for v in df.loc[account].values]
+
+        self.assertEqual(['Expenses:Holiday', 'Expenses:Car', 'Expenses:Savings'], list(targets.index))
+        self.assertEqual([500, 500, 500, 500, None, None], row(targets, 'Expenses:Holiday'))
+        self.assertEqual([None, 100, 100, 100, 100, 100], row(targets, 'Expenses:Savings'))
+        self.assertEqual([3, 2, 1, 0, None, None], row(rem_months, 'Expenses:Holiday'))
+        # counted from the first month that starts after the target was set
+        self.assertEqual([None, 1, 0, None, None, None], row(rem_months, 'Expenses:Car'))
+        self.assertEqual([30, 30, 40, 40, 40, 40], row(targets_monthly, 'Expenses:Fun'))
+
     def test_monthly_targets_ref_amount(self):
         # arrange
         columns = ['2021-01', '2021-02']
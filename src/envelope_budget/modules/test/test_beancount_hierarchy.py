@@ -0,0 +1,28 @@
+import re
+import unittest
+
+import pandas as pd
+from beancount.core.number import D
+
+from envelope_budget.modules.hierarchy.beancount_hierarchy import add_bucket_levels
+
+
+class AddBucketLevelsTests(unittest.TestCase):
+    def test_unmatched_accounts_are_added_below_their_bucket(self):
+        index = pd.MultiIndex.from_tuples([('Expenses:Food', 'Expenses:Food:Groceries'), ('Income', 'Income:Salary')],
+                                          names=['bucket', 'account'])
+        goals = pd.DataFrame({'2020-01': [D('10.00'), D('5.00'), D('7.00')]},
+                             index=['Expenses:Food:Groceries', 'Expenses:Food:Restaurant', 'Expenses:Fun'])
+        mappings = [(re.compile('Expenses:Food:.*'), 'Expenses:Food')]
+
+        df = add_bucket_levels(goals, index, mappings)
+
+        self.assertEqual([('Expenses:Food', 'Expenses:Food:Groceries'), ('Income', 'Income:Salary'),
+                          ('Expenses:Food', 'Expenses:Food:Restaurant'), ('Expenses:Fun', 'Expenses:Fun')],
+                         list(df.index))
+        self.assertEqual(['bucket', 'account'], list(df.index.names))
+        self.assertEqual([D('10.00'), D('0'), D('5.00'), D('7.00')], list(df['2020-01']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+import gc
+import os
+import tempfile
+import threading
+import unittest
+
+from fava.core import FavaLedger
+
+from envelope_budget.modules.budget_cache import BudgetCache
+from envelope_budget.modules.test.ledgers import TWO_BUDGETS as LEDGER
+
+
+class BudgetCacheTests(unittest.TestCase):
+    def test_invalidate_drops_results(self):
+        cache = BudgetCache()
+        key = cache.key('main', '2020-01')
+        cache.put(key, 'result')
+        self.assertEqual('result', cache.get(key))
+
+        cache.invalidate()
+        self.assertIsNone(cache.get(key))
+        self.assertNotEqual(key, cache.key('main', '2020-01'))
+
+    def test_stale_generation_is_not_stored(self):
+        cache = BudgetCache()
+        key = cache.key('main')
+        cache.invalidate()
+        cache.put(key, 'stale')
+        self.assertEqual(0, len(cache))
+
+    def test_get_or_compute_computes_missing_keys_once(self):
+        cache = BudgetCache()
+        main, kids = cache.key('main'), cache.key('kids')
+        started, release = threading.Event(), threading.Event()
+        calls = []
+
+        def compute(keys):
+            calls.append(keys)
+            started.set()
+            release.wait(5)
+            return {k: k[1] for k in keys}
+
+        worker = threading.Thread(target=cache.get_or_compute, args=([main, kids], compute))
+        worker.start()
+        started.wait(5)
+        results = []
+        waiting = threading.Thread(target=lambda: results.append(cache.get_or_compute([kids], compute)))
+        waiting.start()
+        release.set()
+        worker.join(5)
+        waiting.join(5)
+
+        self.assertEqual([[main, kids]], calls)
+        self.assertEqual(['kids'], results)
+        self.assertEqual('main', cache.get_or_compute([main], compute))
+
+    def test_get_or_compute_propagates_errors(self):
+        cache = BudgetCache()
+
+        def compute(keys):
+            raise ValueError('broken')
+
+        self.assertRaises(ValueError, cache.get_or_compute, [cache.key('main')], compute)
+        self.assertEqual('ok', cache.get_or_compute([cache.key('main')], lambda keys: {k: 'ok' for k in keys}))
+
+
+class ExtensionCacheTests(unittest.TestCase):
+    def setUp(self):
+        fd, self.filename = tempfile.mkstemp(suffix='.beancount')
+        with os.fdopen(fd, 'w') as f:
+            f.write(LEDGER)
+        self.ledger = FavaLedger(self.filename)
+        self.ext = self.ledger.extensions.get_extension('EnvelopeBudgetColor')
+
+    def tearDown(self):
+        if self.ext.warm_up is not None:
+            self.ext.warm_up.result()
+        os.remove(self.filename)
+
+    def test_reload_warms_up_all_budgets(self):
+        # nothing is computed before the extension is used
+        self.assertIsNone(self.ext.warm_up)
+        self.assertEqual(0, len(self.ext.cache))
+
+        self.ext.make_table('2020-01', 'False', 'main')
+        self.ledger.load_file()
+        self.ext.warm_up.result()
+        self.assertEqual(2, len(self.ext.cache))
+
+        warm = self.ext.cache.get(self.ext._cache_key('kids'))
+        self.ext.make_table('2020-01', 'False', 'kids')
+        self.assertIs(warm, self.ext.envelopes)
+
+    def test_month_navigation_reuses_result(self):
+        self.ext.make_table('2020-01', 'False', None)
+        first = self.ext.envelopes
+        self.ext.make_table('2020-02', 'True', None)
+        self.assertIs(first, self.ext.envelopes)
+        # both configured budgets were computed at once
+        self.assertEqual(2, len(self.ext.cache))
+
+    def test_budgets_are_cached_separately(self):
+        self.ext.make_table('2020-01', 'False', 'main')
+        main = self.ext.envelopes
+        kids = self.ext.cache.get(self.ext._cache_key('kids'))
+        self.ext.make_table('2020-01', 'False', 'kids')
+        self.assertIsNot(main, self.ext.envelopes)
+        self.assertIs(kids, self.ext.envelopes)
+        self.ext.make_table('2020-02', 'False', 'main')
+        self.assertIs(main, self.ext.envelopes)
+
+    def test_process_pool_follows_the_config(self):
+        self.ext.config = dict(self.ext.config, workers=2)
+        pool = self.ext._workers()
+        self.assertIs(pool, self.ext._workers())
+
+        self.ext.config = dict(self.ext.config, workers=3)
+        self.ext.after_load_file()
+        self.assertTrue(pool._shutdown_thread)
+        other = self.ext._workers()
+        self.assertIsNot(pool, other)
+
+        self.ext.config = dict(self.ext.config, workers=None)
+        self.assertIsNone(self.ext._workers())
+        self.assertTrue(other._shutdown_thread)
+
+    def test_executors_end_with_the_extension(self):
+        ext = type(self.ext)(self.ledger, repr(dict(self.ext.config, workers=2)))
+        pool, warm_up = ext._workers(), ext._warm_up_executor
+        del ext
+        gc.collect()
+        self.assertTrue(pool._shutdown_thread)
+        self.assertTrue(warm_up._shutdown)
+
+    def test_reload_invalidates_result(self):
+        self.ext.make_table('2020-01', 'False', None)
+        first = self.ext.envelopes
+        self.ledger.load_file()
+        self.ext.make_table('2020-01', 'False', None)
+        self.assertIsNot(first, self.ext.envelopes)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import csv
+import importlib.util
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from contextlib import redirect_stderr
+from decimal import Decimal
+
+import pandas as pd
+from fava.core import FavaLedger
+
+from envelope_budget import LoadError
+from envelope_budget.cli import main
+from envelope_budget.modules.test.ledgers import TWO_BUDGETS as LEDGER
+
+
+class CliTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'ledger.beancount')
+        with open(self.filename, 'w') as f:
+            f.write(LEDGER)
+        self.output = os.path.join(self.directory, 'out')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _rows(self, name):
+        with open(os.path.join(self.output, name)) as f:
+            return list(csv.DictReader(f))
+
+    def test_exports_all_budgets(self):
+        stderr = io.StringIO()
+        with redirect_stderr(stderr):
+            main([self.filename, '--output', self.output, '--today', '2020-02-15', '--timings'])
+
+        self.assertEqual(sorted(f'{budget}-{table}.csv' for budget in ('main', 'kids')
+                                for table in ('income', 'envelopes', 'activity')),
+                         sorted(os.listdir(self.output)))
+        self.assertIn('compute', stderr.getvalue())
+
+        food = [r for r in self._rows('main-envelopes.csv') if r['bucket'] == 'Expenses:Food']
+        self.assertEqual(['2020-01', '2020-02'], [r['month'] for r in food])
+        self.assertEqual('100.00', food[0]['budgeted'])
+        self.assertEqual('75.00', food[1]['available'])
+
+        food = [r for r in self._rows('main-activity.csv') if r['account'] == 'Expenses:Food']
+        self.assertEqual('-25.00', food[0]['activity'])
+
+    def test_json(self):
+        main([self.filename, '--output', self.output, '--today', '2020-02-15', '--budget', 'kids',
+              '--format', 'json'])
+
+        self.assertEqual(['kids-activity.json', 'kids-envelopes.json', 'kids-income.json'],
+                         sorted(os.listdir(self.output)))
+        with open(os.path.join(self.output, 'kids-income.json')) as f:
+            income = json.load(f)
+        self.assertEqual(['2020-01', '2020-02'], [r['month'] for r in income])
+
+    @unittest.skipIf(importlib.util.find_spec('pyarrow') is None, 'needs pyarrow (the parquet extra)')
+    def test_parquet(self):
+        main([self.filename, '--output', self.output, '--today', '2020-02-15', '--budget', 'main',
+              '--format', 'parquet'])
+
+        envelopes = pd.read_parquet(os.path.join(self.output, 'main-envelopes.parquet'))
+        self.assertEqual(Decimal('75.00'), envelopes.loc[('Expenses:Food', '2020-02'), 'available'])
+
+    def test_defaults_match_the_page(self):
+        # no future_months nor future_rollover: fava and the export use the same defaults
+        with open(self.filename, 'w') as f:
+            f.write(LEDGER.replace("'future_months': 1, 'future_rollover': True, ", ''))
+        ledger = FavaLedger(self.filename)
+        ext = ledger.extensions.get_extension('EnvelopeBudgetColor')
+        ext.make_table('2020-01', 'False', 'main')
+        self.assertEqual([], [e for e in ledger.errors if isinstance(e, LoadError)])
+
+        main([self.filename, '--output', self.output, '--budget', 'main'])
+        months = sorted({r['month'] for r in self._rows('main-envelopes.csv')})
+        self.assertEqual(list(ext.envelopes.bucket_data.columns.levels[0]), months)
+
+    def test_unknown_budget(self):
+        with redirect_stderr(io.StringIO()), self.assertRaises(SystemExit):
+            main([self.filename, '--output', self.output, '--budget', 'other'])
+
+
+if __name__ == '__main__':
+    unittest.main()
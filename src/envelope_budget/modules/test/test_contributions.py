@@ -0,0 +1,153 @@
+import datetime
+import textwrap
+import unittest
+
+from beancount import loader
+from beancount.core.number import Decimal
+
+from envelope_budget.modules.beancount_envelope import BeancountEnvelope
+from envelope_budget.modules.hierarchy.beancount_entries import TransactionParser, parse_all_transactions
+from envelope_budget.modules.hierarchy.contributions import ContributionStore
+from envelope_budget.modules.ledger_context import LedgerContext
+
+LEDGER = textwrap.dedent("""
+    option "operating_currency" "EUR"
+
+    2011-01-01 open Assets:Checking
+    2011-01-01 open Income:Salary
+    2011-01-01 open Expenses:Food
+    2011-01-01 open Expenses:Fun
+
+    2011-01-01 custom "envelope" "budget account" "Assets:Checking"
+    2020-01-01 custom "envelope" "allocate" "Expenses:Food" 100.00
+    2020-03-01 custom "envelope" "allocate" "Expenses:Fun" 50.00
+
+    2020-01-01 * "Salary"
+      Income:Salary  -1000.00 EUR
+      Assets:Checking
+
+    2020-01-10 * "Food"
+      Expenses:Food  25.00 EUR
+      Assets:Checking
+
+    2020-01-10 * "Food"
+      Expenses:Food  25.00 EUR
+      Assets:Checking
+
+    2020-02-10 * "Fun"
+      Expenses:Fun  35.00 EUR
+      Assets:Checking
+""")
+
+APPENDED = textwrap.dedent("""
+    2020-03-05 * "Food"
+      Expenses:Food  10.00 EUR
+      Assets:Checking
+""")
+
+
+SECOND_BUDGET = textwrap.dedent("""
+    2011-01-01 open Assets:Cash
+
+    2011-01-01 custom "envelope_cash" "budget account" "Assets:Cash"
+    2020-02-01 custom "envelope_cash" "allocate" "Expenses:Fun" 20.00
+
+    2020-02-12 * "Fun"
+      Expenses:Fun  12.00 EUR
+      Assets:Cash
+""")
+
+
+def _parser(context, postfix, store):
+    module = BeancountEnvelope(context, postfix, datetime.date(2020, 1, 1),
+                               today=datetime.date(2020, 3, 15), contributions=store)
+    parser = TransactionParser(module.context, module.currency, module.budget_accounts, module.mappings,
+                               classifier=module.classifier, contributions=store)
+    return parser, module
+
+
+def _parse(text, store):
+    entries, errors, options_map = loader.load_string(text)
+    parser, module = _parser(LedgerContext(entries, errors, options_map), '', store)
+    return parser.parse_transactions(module.date_start, module.date_end, module.income_accounts)
+
+
+class ContributionStoreTests(unittest.TestCase):
+    def test_first_parse_is_complete(self):
+        store = ContributionStore()
+        actual = _parse(LEDGER, store)
+
+        self.assertEqual({(2020, 1), (2020, 2)}, store.dirty_months)
+        self.assertTrue(actual.equals(_parse(LEDGER, None)))
+
+    def test_only_changed_months_are_dirty(self):
+        store = ContributionStore()
+        _parse(LEDGER, store)
+
+        actual = _parse(LEDGER + APPENDED, store)
+        self.assertEqual({(2020, 3)}, store.dirty_months)
+        self.assertTrue(actual.equals(_parse(LEDGER + APPENDED, None)))
+
+        actual = _parse(LEDGER + APPENDED, store)
+        self.assertEqual(set(), store.dirty_months)
+        self.assertTrue(actual.equals(_parse(LEDGER + APPENDED, None)))
+
+    def test_removed_transactions(self):
+        store = ContributionStore()
+        _parse(LEDGER, store)
+
+        # one of two identical transactions is removed
+        edited = LEDGER.replace('2020-01-10 * "Food"\n  Expenses:Food  25.00 EUR\n  Assets:Checking\n', '', 1)
+        actual = _parse(edited, store)
+        self.assertEqual({(2020, 1)}, store.dirty_months)
+        self.assertTrue(actual.equals(_parse(edited, None)))
+
+    def test_changed_settings_reset_the_store(self):
+        store = ContributionStore()
+        _parse(LEDGER, store)
+
+        mapped = LEDGER + '2011-01-01 custom "envelope" "mapping" "Expenses:F.*" "Expenses:Daily"\n'
+        actual = _parse(mapped, store)
+        self.assertEqual({(2020, 1), (2020, 2)}, store.dirty_months)
+        self.assertEqual(['Expenses:Daily', 'Income'], sorted(set(actual.index.get_level_values(0))))
+
+
+def _envelopes(text, store):
+    entries, errors, options_map = loader.load_string(text)
+    parser, module = _parser(LedgerContext(entries, errors, options_map), '', store)
+    return module.envelope_tables(parser)[1]
+
+
+class RolloverReuseTests(unittest.TestCase):
+    def test_reused_after_a_failed_build(self):
+        store = ContributionStore()
+        _envelopes(LEDGER, store)
+
+        # a build updating the contributions, but failing before its rollover is computed
+        _parse(LEDGER + APPENDED, store)
+
+        actual = _envelopes(LEDGER + APPENDED, store)
+        self.assertTrue(actual.equals(_envelopes(LEDGER + APPENDED, ContributionStore())))
+        self.assertEqual(Decimal('-10.00'), actual.loc['Expenses:Food', ('2020-03', 'activity')])
+
+
+class SharedPassTests(unittest.TestCase):
+    def test_budgets_share_one_pass(self):
+        context = LedgerContext(*loader.load_string(LEDGER + SECOND_BUDGET))
+        requests = []
+        for postfix, store in [('', ContributionStore()), ('_cash', None)]:
+            parser, module = _parser(context, postfix, store)
+            requests.append((parser, module.date_start, module.date_end, module.income_accounts))
+
+        shared = parse_all_transactions(requests)
+
+        for (parser, start, end, income_accounts), actual in zip(requests, shared):
+            expected = TransactionParser(parser.context, parser.currency, parser.budget_accounts, parser.mappings) \
+                .parse_transactions(start, end, income_accounts)
+            self.assertTrue(actual.equals(expected))
+        self.assertEqual([('Expenses:Fun', 'Expenses:Fun')], list(shared[1].index))
+        self.assertEqual({(2020, 1), (2020, 2)}, requests[0][0].contributions.dirty_months)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+from beancount import loader
+from fava.core import FavaLedger
+
+from envelope_budget import LoadError
+from envelope_budget.modules import disk_cache
+from envelope_budget.modules.beancount_envelope import BeancountEnvelope
+from envelope_budget.modules.disk_cache import DiskCache, source_hash
+from envelope_budget.modules.envelope_extension import EnvelopeWrapper
+from envelope_budget.modules.ledger_context import LedgerContext
+from envelope_budget.modules.test.ledgers import TWO_BUDGETS as LEDGER
+
+
+class DiskCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = DiskCache(os.path.join(self.directory, 'cache'), EnvelopeWrapper.TABLES)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _wrapper(self, numeric_backend=None):
+        context = LedgerContext(*loader.load_string(LEDGER))
+        return EnvelopeWrapper(BeancountEnvelope(context, '', datetime.date(2020, 1, 1),
+                                                 today=datetime.date(2020, 2, 15), numeric_backend=numeric_backend))
+
+    def test_round_trip(self):
+        for backend in ('decimal', 'int64'):
+            wrapper = self._wrapper(backend)
+            self.assertIsNone(self.cache.get(('main', backend)))
+            self.cache.put(('main', backend), wrapper)
+
+            stored = self.cache.get(('main', backend))
+            for name in EnvelopeWrapper.TABLES:
+                self.assertTrue(getattr(wrapper, name).equals(getattr(stored, name)), name)
+            self.assertEqual(wrapper.account_to_buckets, stored.account_to_buckets)
+            self.assertEqual(wrapper.get_inventories('2020-01', True).account_rows.keys(),
+                             stored.get_inventories('2020-01', True).account_rows.keys())
+
+        # the int64 tables are memory-mapped
+        values = stored.bucket_data.to_numpy()
+        while values.base is not None and not isinstance(values, np.memmap):
+            values = values.base
+        self.assertIsInstance(values, np.memmap)
+
+    def test_unreadable_entry_is_dropped(self):
+        self.cache.put(('main',), self._wrapper())
+        path = self.cache._path(('main',))
+        with open(os.path.join(path, 'state.pickle'), 'wb') as f:
+            f.write(b'broken')
+
+        self.assertIsNone(self.cache.get(('main',)))
+        self.assertFalse(os.path.exists(path))
+
+    def test_failed_write_is_dropped(self):
+        wrapper = self._wrapper()
+        wrapper.unpicklable = lambda: None
+        with self.assertLogs(level='WARNING'):
+            self.cache.put(('main',), wrapper)
+
+        self.assertIsNone(self.cache.get(('main',)))
+        self.assertEqual([], os.listdir(self.cache.directory))
+
+    def test_other_engine_is_not_read(self):
+        self.cache.put(('main',), self._wrapper())
+        try:
+            disk_cache.engine_hash.cache_clear()
+            with mock.patch.object(disk_cache, 'ENGINE_DIRECTORY', self.directory):
+                self.assertIsNone(self.cache.get(('main',)))
+        finally:
+            disk_cache.engine_hash.cache_clear()
+        self.assertIsNotNone(self.cache.get(('main',)))
+
+    def test_source_hash(self):
+        filename = os.path.join(self.directory, 'ledger.beancount')
+        with open(filename, 'w') as f:
+            f.write(LEDGER)
+        first = source_hash([filename])
+        with open(filename, 'a') as f:
+            f.write('\n')
+        self.assertNotEqual(first, source_hash([filename]))
+
+
+class ExtensionDiskCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'ledger.beancount')
+        with open(self.filename, 'w') as f:
+            f.write(LEDGER.replace("'future_rollover': True,", "'future_rollover': True, 'cache_dir': 'cache', "
+                                                               "'warm_up': False,"))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_restart_loads_stored_budgets(self):
+        ext = FavaLedger(self.filename).extensions.get_extension('EnvelopeBudgetColor')
+        ext.make_table('2020-01', 'False', 'main')
+        computed = ext.envelopes
+        self.assertEqual(2, len(os.listdir(os.path.join(self.directory, 'cache'))))
+
+        restarted = FavaLedger(self.filename).extensions.get_extension('EnvelopeBudgetColor')
+        restarted.make_table('2020-01', 'False', 'main')
+        # nothing was parsed
+        self.assertEqual(0, len(restarted.contributions))
+        self.assertTrue(computed.bucket_data.equals(restarted.envelopes.bucket_data))
+
+    def test_unreadable_ledger_file_skips_the_cache(self):
+        ledger = FavaLedger(self.filename)
+        ext = ledger.extensions.get_extension('EnvelopeBudgetColor')
+        ledger.options['include'] = ledger.options['include'] + [os.path.join(self.directory, 'missing.beancount')]
+        with self.assertLogs(level='WARNING'):
+            ext.make_table('2020-01', 'False', 'main')
+
+        self.assertEqual([], [e for e in ledger.errors if isinstance(e, LoadError)])
+        self.assertIsNotNone(ext.envelopes)
+        self.assertFalse(os.path.exists(os.path.join(self.directory, 'cache')))
+
+
+if __name__ == '__main__':
+    unittest.main()
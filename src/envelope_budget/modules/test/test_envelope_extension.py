@@ -0,0 +1,145 @@
+import datetime
+import pickle
+import textwrap
+import unittest
+
+from beancount import loader
+from beancount.core.amount import Amount
+from beancount.core.number import D
+
+from envelope_budget.modules.beancount_envelope import BeancountEnvelope
+from envelope_budget.modules.envelope_extension import EnvelopeWrapper, budget_input, wrapper_from_input
+from envelope_budget.modules.hierarchy.beancount_hierarchy import Bucket
+from envelope_budget.modules.ledger_context import LedgerContext
+
+LEDGER = textwrap.dedent("""
+    option "operating_currency" "EUR"
+
+    2011-01-01 open Assets:Checking
+    2011-01-01 open Income:Salary
+    2011-01-01 open Expenses:Food:Groceries
+    2011-01-01 open Expenses:Food:Restaurant
+    2011-01-01 open Expenses:Fun
+    2011-01-01 open Expenses:FunFair:Rides
+
+    2011-01-01 custom "envelope" "budget account" "Assets:Checking"
+    2011-01-01 custom "envelope" "mapping" "Expenses:Food:.*" "Expenses:Food"
+    2011-01-01 custom "envelope" "mapping" "Expenses:FunFair:.*" "Expenses:FunFair"
+
+    2020-01-01 custom "envelope" "allocate" "Expenses:Food" 100.00
+    2020-01-01 custom "envelope" "allocate" "Expenses:Fun" 20.00
+    2020-01-01 custom "envelope" "target" Expenses:Fun "monthly" 30 EUR
+
+    2020-01-01 * "Salary"
+      Income:Salary  -1000.00 EUR
+      Assets:Checking
+
+    2020-01-10 * "Food"
+      Expenses:Food:Groceries  25.00 EUR
+      Assets:Checking
+
+    2020-01-12 * "Food"
+      Expenses:Food:Restaurant  12.50 EUR
+      Assets:Checking
+
+    2020-01-15 * "Fair"
+      Expenses:FunFair:Rides  8.00 EUR
+      Assets:Checking
+
+""")
+
+
+class PeriodDataTests(unittest.TestCase):
+    def setUp(self):
+        entries, errors, options_map = loader.load_string(LEDGER)
+        module = BeancountEnvelope(LedgerContext(entries, errors, options_map), '', datetime.date(2020, 1, 1),
+                                   today=datetime.date(2020, 2, 15))
+        self.wrapper = EnvelopeWrapper(module)
+
+    def test_rows(self):
+        data = self.wrapper.get_inventories('2020-01', True)
+
+        food = data.account_row('Expenses:Food')
+        self.assertTrue(food.is_bucket)
+        self.assertEqual(D('-37.50'), food.spent.get_currency_units('EUR').number)
+        self.assertEqual(D('62.50'), food.available.get_currency_units('EUR').number)
+
+        groceries = data.account_row('Expenses:Food:Groceries')
+        self.assertTrue(groceries.is_real)
+        self.assertEqual(D('-25.00'), groceries.spent.get_currency_units('EUR').number)
+
+        self.assertEqual('M', data.account_row('Expenses:Fun').goal_type)
+        self.assertFalse(data.is_current)
+        self.assertTrue(self.wrapper.get_inventories('2020-02', True).is_current)
+
+    def test_subtree_totals(self):
+        data = self.wrapper.get_inventories('2020-01', True)
+
+        def total(acc, column):
+            return data.subtree_total(acc, column).get_currency_units('EUR').number
+
+        self.assertEqual(D('-45.50'), total(Bucket('Expenses'), 'spent'))
+        self.assertEqual(D('120.00'), total('Expenses', 'budgeted'))
+        self.assertEqual(D('-37.50'), total(Bucket('Expenses:Food'), 'spent'))
+        self.assertEqual(D('-12.50'), total(Bucket('Expenses:Food:Restaurant', is_real=True), 'spent'))
+        self.assertEqual(D('-37.50'), total(Bucket('Expenses:Food', is_real=True), 'spent'))
+        self.assertEqual(D('-8.00'), total(Bucket('Expenses:FunFair'), 'spent'))
+        # Expenses:FunFair is not part of the Expenses:Fun subtree
+        self.assertEqual(D('20.00'), total(Bucket('Expenses:Fun'), 'available'))
+        self.assertEqual(D('30'), total(Bucket('Expenses:Fun'), 'goals'))
+        self.assertTrue(data.subtree_total(Bucket('Assets'), 'spent').is_empty())
+
+    def test_period_data_is_shared(self):
+        data = self.wrapper.get_inventories('2020-01', False)
+
+        self.assertIs(data, self.wrapper.get_inventories('2020-01', False))
+        self.assertIsNot(data, self.wrapper.get_inventories('2020-01', True))
+        self.assertIsNot(data, self.wrapper.get_inventories('2020-02', False))
+
+    def test_period_data_is_read_only(self):
+        data = self.wrapper.get_inventories('2020-01', True)
+        rows = len(data.account_rows)
+
+        self.assertTrue(data.account_row('Expenses').is_empty())
+        self.assertEqual(rows, len(data.account_rows))
+        with self.assertRaises(TypeError):
+            data.account_rows['Expenses'] = None
+
+        # the empty row of an unknown account is not shared
+        data.account_row('Expenses').spent.add_amount(Amount(D('1.00'), 'EUR'))
+        self.assertTrue(data.account_row('Expenses').is_empty())
+        self.assertTrue(self.wrapper.get_inventories('2020-02', True).account_row('Expenses').is_empty())
+
+    def test_unknown_period(self):
+        data = self.wrapper.get_inventories('2030-01', True)
+        self.assertFalse(data.has_content)
+
+
+class WorkerInputTests(unittest.TestCase):
+    def test_budget_input_computes_the_same_budget(self):
+        context = LedgerContext(*loader.load_string(LEDGER + textwrap.dedent("""
+            2011-01-01 open Assets:Savings
+
+            2020-01-20 * "Transfer outside the budget"
+              Assets:Savings  50.00 EUR
+              Income:Salary
+        """)))
+        options = dict(start_date=datetime.date(2020, 1, 1), today=datetime.date(2020, 2, 15))
+
+        budget = pickle.loads(pickle.dumps(budget_input(context, '', **options)))
+        self.assertEqual(4, len([e for e in budget.entries if type(e).__name__ == 'Transaction']))
+
+        wrapper = pickle.loads(pickle.dumps(wrapper_from_input(budget)))
+        expected = EnvelopeWrapper(BeancountEnvelope(context, '', **options))
+        self.assertTrue(expected.bucket_data.equals(wrapper.bucket_data))
+        self.assertTrue(expected.account_data.equals(wrapper.account_data))
+        for show_real in (False, True):
+            data = wrapper.get_inventories('2020-01', show_real)
+            self.assertEqual(expected.get_inventories('2020-01', show_real).account_rows.keys(),
+                             data.account_rows.keys())
+            self.assertEqual(D('-8.00'), data.subtree_total(Bucket('Expenses:FunFair'), 'spent')
+                             .get_currency_units('EUR').number)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -12,6 +12,7 @@
 from envelope_budget.modules.goals import Target, SpendingTarget
 from envelope_budget.modules.goals.beancount_goals import EnvelopesWithGoals
 from envelope_budget.modules.goals.target_types.goal import NeededForSpendingTargetParser
+from envelope_budget.modules.ledger_context import LedgerContext
 
 
 class TargetFromFavaBudgetTests(cmptest.TestCase):
@@ -39,9 +40,10 @@ def test_spending_target_equal_budgets(self):
             2016-06-01 custom "envelope" "spending" Expenses:Holiday      "yearly"     2500.00 EUR "by" 2016-12-15
         """)
         entries, errors, options_map = loader.load_string(input_text)
+        context = LedgerContext(entries, errors, options_map)
         self.assertFalse(errors)
 
-        bg = EnvelopesWithGoals(entries, errors, options_map, 'EUR')
+        bg = EnvelopesWithGoals(context, 'EUR')
         df = bg.parse_fava_budget('2022-01-01', '2022-04-01')
         self.assertIsNotNone(df)
         print(df)
@@ -5,6 +5,7 @@
 from beancount.parser import cmptest
 
 from envelope_budget.modules.goals.beancount_goals import EnvelopesWithGoals
+from envelope_budget.modules.ledger_context import LedgerContext
 
 
 class TargetFromScheduledTransactionTests(cmptest.TestCase):
@@ -28,6 +29,7 @@ def test_target(self):
               Assets:Shared
         """)
         entries, errors, options_map = loader.load_string(input_text)
+        context = LedgerContext(entries, errors, options_map)
         self.assertFalse(errors)
         self.assertEqualEntries("""
     
@@ -48,7 +50,7 @@ def test_target(self):
               Assets:Shared     -50 EUR
         """, entries)
 
-        bg = EnvelopesWithGoals(entries, errors, options_map, 'EUR')
+        bg = EnvelopesWithGoals(context, 'EUR')
         goals = bg.parse_budget_goals('2022-01-01', '2022-04-01', None)
         self.assertIsNotNone(goals)
         print(goals)
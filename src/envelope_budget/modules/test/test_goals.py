@@ -10,6 +10,7 @@
 from envelope_budget.modules.goals import Target
 from envelope_budget.modules.goals.beancount_goals import EnvelopesWithGoals
 from envelope_budget.modules.goals.target_types.goal import CustomGoalTargetParser
+from envelope_budget.modules.ledger_context import LedgerContext
 
 
 class TargetFromCustomGoalTests(cmptest.TestCase):
@@ -28,9 +29,10 @@ def test_target_existing(self):
             
         """)
         entries, errors, options_map = loader.load_string(input_text)
+        context = LedgerContext(entries, errors, options_map)
         self.assertFalse(errors)
 
-        bg = EnvelopesWithGoals(entries, errors, options_map, 'EUR')
+        bg = EnvelopesWithGoals(context, 'EUR')
         (df1, df2, df3) = bg.parse_budget_goals('2022-01-01', '2022-04-01', entries)
         self.assertIsNotNone(df1)
         self.assertIsNotNone(df2)  # TODO: Holiday goal is not reflected, maybe because we don't have a budget.
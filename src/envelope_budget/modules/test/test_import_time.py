@@ -0,0 +1,76 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from envelope_budget.modules.test.ledgers import TREE as LEDGER
+
+# seconds `import envelope_budget` may take once fava itself is loaded
+IMPORT_BUDGET = 0.25
+
+# the engine is only imported when a budget is computed
+DEFERRED = ('pandas', 'numpy', 'dateutil', 'beancount.query', 'fava.core.budgets', 'ipdb',
+            'envelope_budget.modules.beancount_envelope', 'envelope_budget.modules.envelope_extension')
+
+SCRIPT = """
+import json, sys, time
+import fava.application
+before = set(sys.modules)
+start = time.perf_counter()
+import envelope_budget
+seconds = time.perf_counter() - start
+print(json.dumps({'seconds': seconds, 'modules': sorted(set(sys.modules) - before)}))
+"""
+
+LOAD_SCRIPT = """
+import json, sys, time
+from fava.core import FavaLedger
+before = set(sys.modules)
+FavaLedger(sys.argv[1])
+time.sleep(0.5)
+print(json.dumps({'modules': sorted(set(sys.modules) - before)}))
+"""
+
+
+class ImportTimeTests(unittest.TestCase):
+    def _run(self, script, *args):
+        src = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join([src, os.environ.get('PYTHONPATH', '')]))
+        output = subprocess.run([sys.executable, '-c', script, *args], env=env, check=True, capture_output=True,
+                                text=True)
+        return json.loads(output.stdout.splitlines()[-1])
+
+    def _import(self):
+        return self._run(SCRIPT)
+
+    def test_engine_is_not_imported(self):
+        modules = self._import()['modules']
+        self.assertEqual([], [m for m in modules if m.startswith(DEFERRED)])
+
+    def test_loading_a_ledger_does_not_import_the_engine(self):
+        fd, filename = tempfile.mkstemp(suffix='.beancount')
+        with os.fdopen(fd, 'w') as f:
+            f.write(LEDGER)
+        try:
+            modules = self._run(LOAD_SCRIPT, filename)['modules']
+        finally:
+            os.remove(filename)
+        self.assertIn('envelope_budget', modules)
+        # fava imports its own budgets module
+        self.assertEqual([], [m for m in modules if m.startswith(DEFERRED) and m != 'fava.core.budgets'])
+
+    def test_import_budget(self):
+        # the best of a few runs, to not fail on a busy machine
+        seconds = min(self._import()['seconds'] for _ in range(3))
+        self.assertLess(seconds, IMPORT_BUDGET)
+
+    def test_engine_is_still_reachable(self):
+        import envelope_budget
+        from envelope_budget.modules.envelope_extension import EnvelopeWrapper
+        self.assertIs(EnvelopeWrapper, envelope_budget.EnvelopeWrapper)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import datetime
+import os
+import tempfile
+import textwrap
+import unittest
+
+from beancount import loader
+from beancount.core import prices
+from beancount.core.number import D
+from fava.core import FavaLedger
+
+from envelope_budget.modules.ledger_context import LedgerContext
+
+LEDGER = textwrap.dedent("""
+    option "operating_currency" "EUR"
+
+    2011-01-01 open Assets:Checking
+      name: "Checking"
+    2011-01-01 open Expenses:Food
+
+    2011-01-01 custom "envelope" "budget account" "Assets:Checking"
+    2020-01-01 price USD 0.90 EUR
+
+    2020-01-10 * "Food"
+      Expenses:Food  25.00 EUR
+      Assets:Checking
+""")
+
+
+class LedgerContextTests(unittest.TestCase):
+    def test_indexes_from_entries(self):
+        entries, errors, options_map = loader.load_string(LEDGER)
+        context = LedgerContext(entries, errors, options_map)
+
+        self.assertEqual(1, len(context.transactions))
+        self.assertEqual(["envelope"], [e.type for e in context.custom])
+        self.assertEqual(tuple(context.custom), context.custom_of_type("envelope"))
+        self.assertEqual((), context.custom_of_type("envelope_other"))
+        self.assertEqual(tuple(context.custom), context.custom_of_type("envelope", "budget account"))
+        self.assertEqual((), context.custom_of_type("envelope", "mapping"))
+        self.assertEqual('Checking', context.account_meta['Assets:Checking']['name'])
+        self.assertEqual(D('0.90'), prices.get_price(context.price_map, ('USD', 'EUR'), datetime.date(2020, 2, 1))[1])
+        self.assertIs(context.price_map, context.price_map)
+
+    def test_transactions_between(self):
+        entries, errors, options_map = loader.load_string(LEDGER + textwrap.dedent("""
+            2020-01-31 * "Food"
+              Expenses:Food  5.00 EUR
+              Assets:Checking
+
+            2020-02-01 * "Food"
+              Expenses:Food  7.00 EUR
+              Assets:Checking
+        """))
+        context = LedgerContext(entries, errors, options_map)
+
+        def dates(start, end):
+            return [e.date.day for e in context.transactions_between(start, end)]
+
+        self.assertEqual([10, 31], dates(datetime.date(2020, 1, 10), datetime.date(2020, 1, 31)))
+        self.assertEqual([31, 1], dates(datetime.date(2020, 1, 11), datetime.date(2020, 2, 1)))
+        self.assertEqual([], dates(datetime.date(2020, 2, 2), datetime.date(2020, 12, 31)))
+
+    def test_reuses_fava_indexes(self):
+        fd, filename = tempfile.mkstemp(suffix='.beancount')
+        with os.fdopen(fd, 'w') as f:
+            f.write(LEDGER)
+        try:
+            ledger = FavaLedger(filename)
+            context = LedgerContext.from_fava(ledger)
+
+            self.assertIs(ledger.all_entries_by_type.Transaction, context.transactions)
+            self.assertIs(ledger.all_entries_by_type.Custom, context.custom)
+            self.assertIn('Assets:Checking', context.account_meta)
+        finally:
+            os.remove(filename)
+
+
+if __name__ == '__main__':
+    unittest.main()
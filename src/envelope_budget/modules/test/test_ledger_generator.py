@@ -0,0 +1,28 @@
+import unittest
+
+from beancount import loader
+
+from envelope_budget.benchmarks.ledger_generator import LedgerParameters, generate_ledger
+
+
+class LedgerGeneratorTests(unittest.TestCase):
+    def setUp(self):
+        self.params = LedgerParameters(years=1, accounts=6, envelopes=3, mapping_rules=2, transactions_per_month=4,
+                                       targets=2, spending=2)
+
+    def test_deterministic(self):
+        self.assertEqual(generate_ledger(self.params), generate_ledger(self.params))
+        self.assertNotEqual(generate_ledger(self.params),
+                            generate_ledger(LedgerParameters(**{**self.params.as_dict(), 'seed': 2})))
+
+    def test_loads_without_errors(self):
+        entries, errors, _ = loader.load_string(generate_ledger(self.params))
+
+        self.assertEqual([], errors)
+        transactions = [e for e in entries if type(e).__name__ == 'Transaction']
+        # a salary, the expenses and a refund per month
+        self.assertEqual(12 * (self.params.transactions_per_month + 2), len(transactions))
+
+
+if __name__ == '__main__':
+    unittest.main()
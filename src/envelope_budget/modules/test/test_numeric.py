@@ -0,0 +1,116 @@
+import datetime
+import textwrap
+import unittest
+
+import numpy as np
+import pandas as pd
+from beancount import loader
+from beancount.core.number import D
+
+from envelope_budget.modules.beancount_envelope import BeancountEnvelope
+from envelope_budget.modules.envelope_extension import EnvelopeWrapper
+from envelope_budget.modules.ledger_context import LedgerContext
+from envelope_budget.modules.numeric import DECIMAL, MinorUnitsBackend, get_backend
+
+LEDGER = textwrap.dedent("""
+    option "operating_currency" "EUR"
+
+    2011-01-01 open Assets:Checking
+    2011-01-01 open Income:Salary
+    2011-01-01 open Expenses:Food
+    2011-01-01 open Expenses:Fun
+
+    2011-01-01 custom "envelope" "budget account" "Assets:Checking"
+
+    2020-01-01 custom "envelope" "allocate" "Expenses:Food" 100.00
+    2020-01-01 custom "envelope" "allocate" "Expenses:Fun" 20.00
+    2020-02-01 custom "envelope" "allocate" "Expenses:Food" 80.50
+    2020-01-01 custom "envelope" "spending" Expenses:Food "monthly" 90.00 EUR
+    2020-01-01 custom "envelope" "target" Expenses:Fun "monthly" 30 EUR
+
+    2020-01-01 * "Salary"
+      Income:Salary  -1000.00 EUR
+      Assets:Checking
+
+    2020-01-10 * "Food"
+      Expenses:Food  25.13 EUR
+      Assets:Checking
+
+    2020-02-10 * "Fun"
+      Expenses:Fun  35.00 EUR
+      Assets:Checking
+
+    2020-03-10 * "Food"
+      Expenses:Food  180.01 EUR
+      Assets:Checking
+""")
+
+
+# an allocation with more digits than the currency
+FINE_ALLOCATION = '2020-02-01 custom "envelope" "allocate" "Expenses:Fun" 10.125\n'
+
+
+def _wrapper(numeric_backend, ledger=LEDGER):
+    entries, errors, options_map = loader.load_string(ledger)
+    module = BeancountEnvelope(LedgerContext(entries, errors, options_map), '', datetime.date(2020, 1, 1),
+                               today=datetime.date(2020, 3, 15), numeric_backend=numeric_backend)
+    return EnvelopeWrapper(module)
+
+
+class MinorUnitsBackendTests(unittest.TestCase):
+    def test_backends(self):
+        self.assertIs(DECIMAL, get_backend(None))
+        self.assertIs(DECIMAL, get_backend('decimal'))
+        self.assertIsInstance(get_backend('int64'), MinorUnitsBackend)
+        self.assertRaises(ValueError, get_backend, 'float')
+
+    def test_conversion(self):
+        backend = MinorUnitsBackend(D('0.00'))
+        self.assertEqual(-32601, backend.from_decimal(D('-326.01')))
+        self.assertEqual(1000, backend.from_decimal(D('10.004')))
+        self.assertEqual(0, backend.from_decimal(None))
+        self.assertEqual(D('-326.01'), backend.to_decimal(-32601))
+
+        df = pd.DataFrame({'a': [D('1.50'), np.nan], 'b': [D('-2'), D('0.10')]})
+        converted = backend.from_decimals(df)
+        self.assertEqual([np.int64, np.int64], list(converted.dtypes))
+        self.assertEqual([[150, -200], [0, 10]], converted.values.tolist())
+
+    def test_same_amounts_as_decimal(self):
+        decimals = _wrapper(None)
+        minor_units = _wrapper('int64')
+
+        self.assertTrue((minor_units.bucket_data.dtypes == np.int64).all())
+        for period in decimals.get_budgets_months_available():
+            expected = decimals.get_summary(period).data
+            actual = minor_units.get_summary(period).data
+            self.assertEqual(list(expected), list(actual))
+
+            expected_rows = decimals.get_inventories(period, True).account_rows
+            actual_rows = minor_units.get_inventories(period, True).account_rows
+            self.assertEqual(sorted(expected_rows), sorted(actual_rows))
+            for account, row in expected_rows.items():
+                self.assertEqual(str(row), str(actual_rows[account]))
+
+    def test_amounts_with_more_digits_than_the_currency(self):
+        decimals = _wrapper(None, LEDGER + FINE_ALLOCATION)
+        minor_units = _wrapper('int64', LEDGER + FINE_ALLOCATION)
+
+        self.assertEqual(D('0.001'), minor_units.numeric.quantum)
+        self.assertTrue((minor_units.bucket_data.dtypes == np.int64).all())
+        for name in ('income_tables', 'bucket_data'):
+            expected = getattr(decimals, name)
+            self.assertTrue(expected.equals(minor_units.numeric.decimals(getattr(minor_units, name))), name)
+        self.assertEqual(D('-4.875'), decimals.bucket_data.loc['Expenses:Fun', ('2020-02', 'available')])
+
+        # amounts without more digits are shown as with the currency
+        self.assertEqual('20.00', str(minor_units.numeric.to_decimal(20000)))
+        self.assertEqual('10.125', str(minor_units.numeric.to_decimal(10125)))
+
+    def test_too_many_digits_stay_decimal(self):
+        minor_units = _wrapper('int64', LEDGER + FINE_ALLOCATION.replace('10.125', '10.1234567891'))
+        self.assertIs(DECIMAL, minor_units.numeric)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import os
+import tempfile
+import unittest
+
+from fava.application import create_app
+from envelope_budget.modules.test.ledgers import TREE as LEDGER
+
+URL = '/beancount/extension/EnvelopeBudgetColor/period?period=2020-01&show_accounts=True'
+
+
+class PeriodJsonTests(unittest.TestCase):
+    def setUp(self):
+        fd, self.filename = tempfile.mkstemp(prefix='beancount', suffix='.beancount')
+        with os.fdopen(fd, 'w') as f:
+            f.write(LEDGER)
+        app = create_app([self.filename], load=True)
+        app.testing = True
+        self.client = app.test_client()
+
+    def tearDown(self):
+        os.remove(self.filename)
+
+    def test_period(self):
+        response = self.client.get(URL)
+        self.assertEqual(200, response.status_code)
+
+        period = response.get_json()
+        self.assertEqual('2020-01', period['period'])
+        self.assertEqual(1000, period['summary']['income'])
+
+        self.assertEqual(['Expenses', 'Income'], [r['account'] for r in period['rows']])
+        food = period['rows'][0]['children'][0]
+        self.assertEqual('Expenses:Food', food['account'])
+        self.assertEqual(62.5, food['totals']['available'])
+        self.assertEqual(['Eating out', 'Groceries'], [c['name'] for c in food['children']])
+
+    def test_conditional_request(self):
+        etag = self.client.get(URL).headers['ETag']
+
+        response = self.client.get(URL, headers={'If-None-Match': etag})
+        self.assertEqual(304, response.status_code)
+        self.assertEqual(etag, response.headers['ETag'])
+
+        other = self.client.get(URL.replace('2020-01', '2020-02'), headers={'If-None-Match': etag})
+        self.assertEqual(200, other.status_code)
+        self.assertNotEqual(etag, other.headers['ETag'])
+
+    def test_invalid_requests(self):
+        self.assertEqual(400, self.client.get(URL.replace('2020-01', 'garbage')).status_code)
+        self.assertEqual(404, self.client.get(URL.replace('2020-01', '1999-01')).status_code)
+        self.assertEqual(404, self.client.get(URL + '&budget=other').status_code)
+        self.assertEqual(200, self.client.get(URL + '&budget=main').status_code)
+
+
+if __name__ == '__main__':
+    unittest.main()
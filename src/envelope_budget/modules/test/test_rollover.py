@@ -0,0 +1,54 @@
+import unittest
+
+import numpy as np
+from beancount.core.number import D
+
+from envelope_budget.modules.rollover import rollover_available, overspent
+
+
+def _matrix(rows):
+    return np.array([[D(v) for v in row] for row in rows], dtype=object)
+
+
+class RolloverTests(unittest.TestCase):
+    def setUp(self):
+        self.budgeted = _matrix([['100', '0', '50', '0'],
+                                 ['20', '20', '0', '0']])
+        self.activity = _matrix([['-40', '-10', '-150', '-5'],
+                                 ['-30', '-5', '-10', '0']])
+
+    def test_positive_balance_rolls_over(self):
+        available = rollover_available(self.budgeted, self.activity, max_index=4)
+
+        self.assertEqual([D('60'), D('50'), D('-50'), D('-5')], list(available[0]))
+        self.assertEqual([D('-10'), D('15'), D('5'), D('5')], list(available[1]))
+
+    def test_no_rollover_after_max_index(self):
+        available = rollover_available(self.budgeted, self.activity, max_index=1)
+
+        self.assertEqual([D('60'), D('50'), D('-100'), D('-5')], list(available[0]))
+        self.assertEqual([D('-10'), D('15'), D('-10'), D('0')], list(available[1]))
+
+    def test_recompute_from_start(self):
+        previous = rollover_available(self.budgeted, self.activity, max_index=4)
+        self.activity[0, 3] = D('-20')
+
+        available = rollover_available(self.budgeted, self.activity, max_index=4, previous=previous, start=3)
+        self.assertEqual([D('60'), D('50'), D('-50'), D('-20')], list(available[0]))
+        self.assertEqual(list(previous[1]), list(available[1]))
+
+    def test_overspent_of_previous_month(self):
+        available = rollover_available(self.budgeted, self.activity, max_index=4)
+
+        self.assertEqual([D('0'), D('-10'), D('0'), D('-50')], list(overspent(available)))
+
+    def test_no_envelopes(self):
+        empty = np.empty((0, 3), dtype=object)
+        available = rollover_available(empty, empty, max_index=3)
+
+        self.assertEqual((0, 3), available.shape)
+        self.assertEqual([D('0')] * 3, list(overspent(available)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import datetime
+import unittest
+from collections import defaultdict
+
+import numpy as np
+from beancount.core.number import D
+from fava.core.budgets import Budget, Interval, calculate_budget
+
+from envelope_budget.modules.goals.spending import evaluate_budgets
+
+MONTHS = np.arange('2020-01', '2021-01', dtype='datetime64[M]').astype('datetime64[D]')
+
+
+def _budgets(*budgets):
+    result = defaultdict(list)
+    for b in budgets:
+        result[b.account].append(b)
+    return result
+
+
+class EvaluateBudgetsTests(unittest.TestCase):
+    def test_intervals(self):
+        budgets = _budgets(
+            Budget('Expenses:Coffee', datetime.date(2020, 1, 1), Interval.DAY, D('4.00'), 'EUR'),
+            Budget('Expenses:Books', datetime.date(2020, 1, 1), Interval.WEEK, D('20.00'), 'EUR'),
+            Budget('Expenses:Groceries', datetime.date(2020, 2, 10), Interval.MONTH, D('40.00'), 'EUR'),
+            Budget('Expenses:Electricity', datetime.date(2020, 5, 1), Interval.QUARTER, D('85.00'), 'EUR'),
+            Budget('Expenses:Holiday', datetime.date(2020, 6, 1), Interval.YEAR, D('2500.00'), 'EUR'),
+        )
+        values, missing = evaluate_budgets(budgets, MONTHS, 'EUR', D('0.00'))
+
+        for month in MONTHS.tolist():
+            name = f'{month.year}-{month.month:02}'
+            end = datetime.date(month.year + month.month // 12, month.month % 12 + 1, 1)
+            for account in budgets:
+                expected = calculate_budget(budgets, account, month, end).get('EUR')
+                actual = values[name].get(account)
+                self.assertEqual(expected.quantize(D('0.00')) if expected is not None else None, actual,
+                                 f'{account} {name}')
+
+        self.assertEqual(D('124.00'), values['2020-01']['Expenses:Coffee'])
+        self.assertEqual(D('27.59'), values['2020-02']['Expenses:Groceries'])
+        self.assertEqual(['2020-01'], missing['Expenses:Groceries'])
+        self.assertNotIn('Expenses:Coffee', missing)
+
+    def test_later_budget_replaces_earlier(self):
+        budgets = _budgets(
+            Budget('Expenses:Food', datetime.date(2020, 1, 1), Interval.MONTH, D('100.00'), 'EUR'),
+            Budget('Expenses:Food', datetime.date(2020, 3, 16), Interval.MONTH, D('310.00'), 'EUR'),
+        )
+        values, _ = evaluate_budgets(budgets, MONTHS, 'EUR', D('0.00'))
+
+        self.assertEqual(D('100.00'), values['2020-02']['Expenses:Food'])
+        self.assertEqual(D('208.39'), values['2020-03']['Expenses:Food'])
+        self.assertEqual(D('310.00'), values['2020-04']['Expenses:Food'])
+
+    def test_other_currency_is_missing(self):
+        budgets = _budgets(Budget('Expenses:Food', datetime.date(2020, 1, 1), Interval.MONTH, D('100.00'), 'USD'))
+        values, missing = evaluate_budgets(budgets, MONTHS, 'EUR', D('0.00'))
+
+        self.assertEqual(dict(), values['2020-01'])
+        self.assertEqual(12, len(missing['Expenses:Food']))
+
+
+if __name__ == '__main__':
+    unittest.main()
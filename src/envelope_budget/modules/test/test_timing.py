@@ -0,0 +1,69 @@
+import os
+import tempfile
+import unittest
+
+from fava.application import create_app
+
+from envelope_budget.modules.timing import NO_SPAN, Timings, collect, span
+from envelope_budget.modules.test.ledgers import TREE as LEDGER
+
+URL = '/beancount/extension/EnvelopeBudgetColor/?period=2020-01&show_accounts=False'
+
+
+class SpanTests(unittest.TestCase):
+    def test_nothing_measured_by_default(self):
+        self.assertIs(NO_SPAN, span('rollover'))
+
+    def test_nested_spans(self):
+        timings = Timings()
+        with collect(timings):
+            with span('budget'):
+                with span('rollover'):
+                    pass
+                with span('rollover'):
+                    pass
+            with span('tree rows'):
+                pass
+        self.assertIs(NO_SPAN, span('rollover'))
+
+        self.assertEqual(['budget', 'budget/rollover', 'tree rows'], list(timings.as_dict()))
+        self.assertEqual(timings.stages[('budget',)] + timings.stages[('tree rows',)], timings.total)
+        self.assertLessEqual(timings.stages[('budget', 'rollover')], timings.stages[('budget',)])
+
+    def test_span_ends_with_an_exception(self):
+        timings = Timings()
+        with collect(timings):
+            with self.assertRaises(KeyError), span('budget'):
+                raise KeyError()
+            with span('tree rows'):
+                pass
+        self.assertEqual(['budget', 'tree rows'], list(timings.as_dict()))
+
+
+class PageTimingsTests(unittest.TestCase):
+    def _client(self, ledger):
+        fd, self.filename = tempfile.mkstemp(prefix='beancount', suffix='.beancount')
+        with os.fdopen(fd, 'w') as f:
+            f.write(ledger)
+        app = create_app([self.filename], load=True)
+        app.testing = True
+        return app.test_client()
+
+    def tearDown(self):
+        os.remove(self.filename)
+
+    def test_footer_and_log(self):
+        client = self._client(LEDGER.replace("'future_rollover': True,", "'future_rollover': True, 'timings': True, "
+                                                                           "'warm_up': False,"))
+        with self.assertLogs(level='INFO') as logs:
+            html = client.get(URL).get_data(as_text=True)
+
+        self.assertIn('envelope-timings', html)
+        logged = [line for line in logs.output if 'timings: ' in line]
+        self.assertEqual(1, len(logged))
+        for stage in ('make table/budget', 'envelope tables/rollover', 'spending goals', 'render/tree rows'):
+            self.assertIn(stage, logged[0])
+
+    def test_disabled(self):
+        html = self._client(LEDGER).get(URL).get_data(as_text=True)
+        self.assertNotIn('envelope-timings', html)
@@ -0,0 +1,57 @@
+import os
+import tempfile
+import unittest
+
+from fava.core import FavaLedger
+from envelope_budget.modules.test.ledgers import TREE as LEDGER
+
+
+class TreeRowsTests(unittest.TestCase):
+    def setUp(self):
+        fd, self.filename = tempfile.mkstemp(suffix='.beancount')
+        with os.fdopen(fd, 'w') as f:
+            f.write(LEDGER)
+        self.ledger = FavaLedger(self.filename)
+        self.extension = self.ledger.extensions.get_extension('EnvelopeBudgetColor')
+
+    def tearDown(self):
+        os.remove(self.filename)
+
+    def test_rows_in_display_order(self):
+        self.extension.make_table('2020-01', 'True', None)
+        rows = self.extension.tree_rows()
+
+        self.assertEqual(['Expenses', 'Expenses:Food', 'Expenses:Food:Restaurant', 'Expenses:Food:Groceries',
+                          'Expenses:Fun', 'Income', 'Income:Salary'], [r.account for r in rows])
+        self.assertEqual([0, 1, 2, 2, 1, 0, 1], [r.depth for r in rows])
+        # every opened level is closed again
+        self.assertEqual(len(rows), sum(r.close for r in rows))
+        self.assertEqual([0, 0, 1, 2, 2, 0, 2], [r.close for r in rows])
+
+        food = rows[1]
+        self.assertTrue(food.has_children)
+        self.assertTrue(food.is_bucket)
+        self.assertEqual('Food', food.display_name)
+        self.assertEqual('-37.50', food.spent.strip())
+        self.assertEqual('62.50', food.available.strip())
+
+        restaurant = rows[2]
+        self.assertEqual('Eating out', restaurant.display_name)
+        self.assertTrue(restaurant.is_real_account)
+        self.assertTrue(restaurant.is_non_budget)
+        self.assertEqual('-12.50', restaurant.spent_children.strip())
+
+    def test_rows_are_cached(self):
+        self.extension.make_table('2020-01', 'False', None)
+        rows = self.extension.tree_rows()
+
+        self.assertNotIn('Expenses:Food:Groceries', [r.account for r in rows])
+        self.assertIs(rows, self.extension.tree_rows())
+
+        self.extension.after_load_file()
+        self.extension.make_table('2020-01', 'False', None)
+        self.assertIsNot(rows, self.extension.tree_rows())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import contextlib
+import contextvars
+import time
+
+# the Timings of the current request (or command), None when nothing is measured
+_current = contextvars.ContextVar('envelope_budget_timings', default=None)
+
+
+class Timings:
+    """Wall-clock seconds per (nested) stage, in the order the stages started."""
+
+    def __init__(self):
+        self.stages = dict()
+        self._path = ()
+
+    def start(self, name):
+        self._path = self._path + (name,)
+        self.stages.setdefault(self._path, 0.0)
+        return self._path
+
+    def stop(self, path, seconds):
+        self.stages[path] += seconds
+        self._path = path[:-1]
+
+    def add(self, name, seconds):
+        """A stage measured elsewhere, below the current one."""
+        self.stop(self.start(name), seconds)
+
+    @property
+    def total(self):
+        return sum(seconds for path, seconds in self.stages.items() if len(path) == 1)
+
+    def as_dict(self):
+        return {'/'.join(path): round(seconds, 6) for path, seconds in self.stages.items()}
+
+    def lines(self):
+        width = max((2 * len(path) + len(path[-1]) for path in self.stages), default=0)
+        return [f"{'  ' * (len(path) - 1) + path[-1]:<{width}} {seconds * 1000:9.1f} ms"
+                for path, seconds in self.stages.items()]
+
+    def __str__(self):
+        return '\n'.join(self.lines())
+
+
+class _Span:
+    __slots__ = ('timings', 'name', 'path', 'start')
+
+    def __init__(self, timings, name):
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self):
+        self.path = self.timings.start(self.name)
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.timings.stop(self.path, time.perf_counter() - self.start)
+        return False
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        return False
+
+
+NO_SPAN = _NoSpan()
+
+
+def span(name):
+    """Measure a stage (as `with span('rollover'):`) if timings are collected, else do nothing."""
+    timings = _current.get()
+    return NO_SPAN if timings is None else _Span(timings, name)
+
+
+@contextlib.contextmanager
+def collect(timings):
+    """Collect the spans of this thread (or task) in `timings`; None measures nothing."""
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
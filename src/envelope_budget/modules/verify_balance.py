@@ -6,16 +6,11 @@
 from dateutil.relativedelta import relativedelta
 
 from envelope_budget.modules.envelope_extension import EnvelopeWrapper
-
-try:
-    import ipdb
-    #ipdb.set_trace()
-except ImportError:
-    pass
+from envelope_budget.modules.ledger_context import LedgerContext
 
 from beancount import loader
 
-from src.fava_envelope.modules.beancount_envelope import BeancountEnvelope
+from envelope_budget.modules.beancount_envelope import BeancountEnvelope
 
 
 def main():
@@ -27,8 +22,9 @@ def main():
 
     # Read beancount input file
     entries, errors, options_map = loader.load_file(args.filename)
-    ext = BeancountEnvelope(entries, errors, options_map)
-    ge = EnvelopeWrapper(entries, errors, options_map, ext)
+    context = LedgerContext(entries, errors, options_map)
+    ext = BeancountEnvelope(context, '')
+    ge = EnvelopeWrapper(ext)
 
     eom_balance, positions = ext.query_account_balances(ext.date_start)
     logging.info(positions.to_string())
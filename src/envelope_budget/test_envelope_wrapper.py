@@ -9,12 +9,7 @@
 from envelope_budget.modules.beancount_envelope import BeancountEnvelope
 from envelope_budget.modules.goals.beancount_goals import EnvelopesWithGoals, merge_all_targets, get_targets
 from envelope_budget.modules.hierarchy.beancount_entries import TransactionParser
-
-try:
-    import ipdb
-    #ipdb.set_trace()
-except ImportError:
-    pass
+from envelope_budget.modules.ledger_context import LedgerContext
 
 from beancount import loader
 
@@ -25,10 +20,11 @@ def test_extension_2021(self):
 
         # Read beancount input file
         entries, errors, options_map = loader.load_file(filename)
-        module = BeancountEnvelope(entries, errors, options_map, budget_postfix='',
+        context = LedgerContext(entries, errors, options_map)
+        module = BeancountEnvelope(context, budget_postfix='',
                                    today=dt.date(2021, 10, 1))
 
-        ew = EnvelopeWrapper(entries, errors, options_map, module)
+        ew = EnvelopeWrapper(module)
         pd = ew.get_inventories('2021-10', include_real_accounts=False)
         fun_money = pd.account_row('Expenses:FunMoney:EatingOut')
         print(fun_money)
@@ -41,11 +37,12 @@ def test_extension_2023(self):
 
         # Read beancount input file
         entries, errors, options_map = loader.load_file(filename)
-        module = BeancountEnvelope(entries, errors, options_map,
+        context = LedgerContext(entries, errors, options_map)
+        module = BeancountEnvelope(context,
                                    budget_postfix='_private',
                                    today=dt.date(2023, 4, 12))
 
-        ew = EnvelopeWrapper(entries, errors, options_map, module)
+        ew = EnvelopeWrapper(module)
         pd = ew.get_inventories('2023-04', include_real_accounts=False)
         self.assertNotEqual(0, len(pd.account_rows))
         print(f"Rows: {len(pd.account_rows)}")
@@ -58,11 +55,12 @@ def test_extension_integration(self):
 
         # Read beancount input file
         entries, errors, options_map = loader.load_file(filename)
-        module = BeancountEnvelope(entries, errors, options_map,
+        context = LedgerContext(entries, errors, options_map)
+        module = BeancountEnvelope(context,
                                    budget_postfix='EUR',
                                    today=dt.date(2024, 5, 5))
 
-        ew = EnvelopeWrapper(entries, errors, options_map, module)
+        ew = EnvelopeWrapper(module)
         pd = ew.get_inventories('2024-04', include_real_accounts=False)
         self.assertNotEqual(0, len(pd.account_rows))
 
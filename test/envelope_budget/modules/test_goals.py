@@ -7,12 +7,7 @@
 from envelope_budget.modules.beancount_envelope import BeancountEnvelope
 from envelope_budget.modules.goals.beancount_goals import EnvelopesWithGoals, merge_all_targets, get_targets
 from envelope_budget.modules.hierarchy.beancount_entries import TransactionParser
-
-try:
-    import ipdb
-    #ipdb.set_trace()
-except ImportError:
-    pass
+from envelope_budget.modules.ledger_context import LedgerContext
 
 from beancount import loader
 
@@ -27,18 +22,19 @@ def test_goals(self):
 
         # Read beancount input file
         entries, errors, options_map = loader.load_file(filename)
+        context = LedgerContext(entries, errors, options_map)
 
         self.assertGreater(len(entries), 0)
 
-        module = BeancountEnvelope(entries, errors, options_map, budget_postfix='',
+        module = BeancountEnvelope(context, budget_postfix='',
                                    today=dt.date(2021, 10, 1))
-        parser = TransactionParser(entries, errors, options_map,
+        parser = TransactionParser(context,
                                    currency=module.currency,
                                    budget_accounts=module.budget_accounts,
                                    mappings=module.mappings)
 
         income_tables, envelope_tables, all_activity, current_month = module.envelope_tables(parser)
-        bg = EnvelopesWithGoals(entries, errors, options_map, module.currency)
+        bg = EnvelopesWithGoals(context, module.currency)
 
         detail_goals, spending = bg.get_spending_goals(module.date_start, module.date_end, module.mappings, all_activity.index, envelope_tables, current_month)
 